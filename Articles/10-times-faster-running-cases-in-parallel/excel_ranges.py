@@ -0,0 +1,47 @@
+# Racks and shelves: load named ranges from an Excel file
+# Opening a workbook with openpyxl is the slow part of loading data, especially for a large file like pallets-20000.xlsx. So loadRanges opens the workbook once
+# for all the ranges that it is given, rather than once for each range.
+# Each range is also saved in a cache file next to the workbook, <workbook>-cache.npz, with one array for each column so that the data types are kept.
+# Later runs read the ranges from the cache, without openpyxl, until the workbook is modified.
+
+import os
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
+
+def cacheFilename(excelFile):   # Cache file for a workbook
+    return os.path.splitext(excelFile)[0] + '-cache.npz'
+
+def readCache(excelFile, modified):   # Cached columns, keyed by 'worksheet!range#column'. Empty if there is no cache or the workbook has been modified since the cache was saved
+    cacheFile = cacheFilename(excelFile)
+    if not os.path.exists(cacheFile):
+        return {}
+    with np.load(cacheFile, allow_pickle = True) as cache:   # Columns of text or mixed values are saved as object arrays
+        if cache['modified'] != modified:
+            return {}
+        return {key: cache[key] for key in cache.files if key != 'modified'}
+
+# Load a list of named ranges from a worksheet, returning a dictionary of DataFrames, one for each range
+def loadRanges(excelFile, worksheet, rangeNames, useCache = True):
+    modified = os.path.getmtime(excelFile)
+    columns = readCache(excelFile, modified) if useCache else {}
+    missing = [rangeName for rangeName in rangeNames if f'{worksheet}!{rangeName}#0' not in columns]
+    if missing:   # Open the workbook once, for all the ranges not in the cache
+        wb = load_workbook(filename = excelFile, read_only = True)
+        ws = wb[worksheet]
+        for rangeName in missing:
+            for title, coord in wb.defined_names[rangeName].destinations:
+                min_col, min_row, max_col, max_row = range_boundaries(coord)
+                data = ws.iter_rows(min_row, max_row, min_col, max_col, values_only = True)
+            df = pd.DataFrame(data)
+            for column in df.columns:
+                columns[f'{worksheet}!{rangeName}#{column}'] = df[column].to_numpy()
+        wb.close()
+        if useCache:
+            np.savez(cacheFilename(excelFile), modified = modified, **columns)
+    ranges = {}
+    for rangeName in rangeNames:
+        prefix = f'{worksheet}!{rangeName}#'
+        ranges[rangeName] = pd.DataFrame({int(key[len(prefix):]): values for key, values in columns.items() if key.startswith(prefix)})
+    return ranges
@@ -6,9 +6,12 @@ from datetime import datetime
 import os as os
 import pandas as pd
 import numpy as np
-from openpyxl import load_workbook
-from openpyxl.utils.cell import range_boundaries
-from mpi4py import MPI
+import shelf_cases
+import excel_ranges
+try:
+    from mpi4py import MPI
+except ImportError:   # Without mpi4py, run all cases in this process
+    MPI = None
 
 # User selections
 dataFile = os.path.join(os.getcwd() + '\data', 'pallets-20000.xlsx')
@@ -16,6 +19,14 @@ casesFile = os.path.join(os.getcwd() + '\data', 'ShelfCases-6-0.xlsx')
 dataWorksheet = 'Data'
 casesWorksheet = 'Data'
 weightedObj = True
+aggregated = False   # Group pallets by height, with integer allocation of each height to each shelf, so the model size doesn't depend on the number of pallets
+evaluator = 'mip'   # 'mip' = solve a MIP for each case; 'exact' = compute the same optimal objective by counting, without a solver
+prune = False   # Skip cases whose lower bound can't beat the best objective found so far, and give that objective to the solver as a cutoff
+generateCases = False   # Generate shelf cases on the fly with shelf_cases.py, using the assumptions in dataFile, rather than reading them from casesFile
+minShelves = 6   # Rules for generated cases. These settings generate the cases in ShelfCases-6-0.xlsx
+minTallest = 2   # Minimum and maximum number of shelves of the tallest height
+maxTallest = 3
+cacheData = True   # Save the data ranges in a cache file next to each workbook, so later runs don't need to open the workbooks
 
 
 # Solver options
@@ -25,66 +36,91 @@ loadSolution = True
 timeLimit = 1*3600   # per case
 
 # Derived globals
-processesToUse = MPI.COMM_WORLD.Get_size()
+processesToUse = MPI.COMM_WORLD.Get_size() if MPI is not None else 1
 
 # Fixed
+caseData = None   # Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf. Set by initWorker
+incumbent = np.inf   # Best objective found so far, as known to this rank. Rank 0 sends its latest value with each case
 modelName = 'Racks and shelves - Model 4 parallel mpi4py'
 
-# Generic loader from Excel file, given worksheet and named range
-def LoadFromExcel(excelFile, worksheet, rangeName):
-    wb = load_workbook(filename=excelFile, read_only=True)
-    ws = wb[worksheet]
-    dests = wb.defined_names[rangeName].destinations
-    for title, coord in dests:
-        min_col, min_row, max_col, max_row = range_boundaries(coord)
-        data = ws.iter_rows(min_row, max_row, min_col, max_col, values_only = True)
-    df = pd.DataFrame(data)
-    return df
-
 # Load data from Excel file
 def GetData(dataFile, dataWorksheet, casesFile, casesWorksheet):
-    Pallets = LoadFromExcel(dataFile, dataWorksheet, 'Heights')   # List of all pallet sizes (decimetres) that we need to store os shelves
+    dataRanges = excel_ranges.loadRanges(dataFile, dataWorksheet, ['Heights', 'MaxShelves', 'WeightRacks', 'WeightShelves', 'PalletsPerShelf', 'RackHeight', 'Gap', 'MinShelfSize', 'MaxShelfSize'], cacheData)   # Open the data file once, for all ranges, including those used to generate cases
+    Pallets = dataRanges['Heights']   # List of all pallet sizes (decimetres) that we need to store os shelves
     Pallets.columns = ['Sizes']   # Name the pallets column
-    MaxShelves = LoadFromExcel(dataFile, dataWorksheet, 'MaxShelves')   # Maximum number of shelves in a rack
-    WeightRacks = LoadFromExcel(dataFile, dataWorksheet, 'WeightRacks')   # Objective function weight on the variable for number of racks
-    WeightShelves = LoadFromExcel(dataFile, dataWorksheet, 'WeightShelves')   # Objective function weight on the variable for number of shelves
-    ShelfHeights = LoadFromExcel(casesFile, casesWorksheet, 'Cases')   # Height of each shelf in each case
-    ShelfHeights.columns = [str(n).zfill(1) for n in range(1, ShelfHeights.shape[1] + 1)]   # Label columns from '1' to 'n'
-    PalletsPerShelf = LoadFromExcel(dataFile, dataWorksheet, 'PalletsPerShelf')   # Number of pallets on each shelf
+    MaxShelves = dataRanges['MaxShelves']   # Maximum number of shelves in a rack
+    WeightRacks = dataRanges['WeightRacks']   # Objective function weight on the variable for number of racks
+    WeightShelves = dataRanges['WeightShelves']   # Objective function weight on the variable for number of shelves
+    if generateCases:   # Cases come from shelf_cases.py instead
+        ShelfHeights = None
+    else:
+        ShelfHeights = excel_ranges.loadRanges(casesFile, casesWorksheet, ['Cases'], cacheData)['Cases']   # Height of each shelf in each case
+        ShelfHeights.columns = [str(n).zfill(1) for n in range(1, ShelfHeights.shape[1] + 1)]   # Label columns from '1' to 'n'
+    PalletsPerShelf = dataRanges['PalletsPerShelf']   # Number of pallets on each shelf
     return Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf
 
+# The cases to run, as (case, heights) pairs. Generated cases are yielded one at a time. For cases from casesFile, heights is None, as the heights are in the data
+def caseList(data):
+    if generateCases:
+        rules = excel_ranges.loadRanges(dataFile, dataWorksheet, ['MaxShelves', 'RackHeight', 'Gap', 'MinShelfSize', 'MaxShelfSize'], cacheData)
+        rules = [rules[rangeName][0].item() for rangeName in rules]
+        return enumerate(shelf_cases.shelfCases(*rules, data[0]['Sizes'].max(), minShelves = minShelves, minTallest = minTallest, maxTallest = maxTallest))
+    return ((case, None) for case in range(0, len(data[2])))
+
 # Define model data, assigning all data to the Model for the given case
 def DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
     Model.MaxShelves = MaxShelves[0].item()
     Model.WeightRacks = WeightRacks[0].item()
     Model.WeightShelves = WeightShelves[0].item()
     Model.PalletsPerShelf = PalletsPerShelf[0].item()
-    Model.P = pyo.Set(initialize = range(0, len(Pallets)))
+    if aggregated:   # Group pallets by height, so the size of the model doesn't depend on the number of pallets
+        Sizes, Counts = np.unique(Pallets['Sizes'], return_counts = True)
+    else:   # Each pallet separately
+        Sizes, Counts = Pallets['Sizes'].to_numpy(), np.ones(len(Pallets), dtype = int)
+    Model.P = pyo.Set(initialize = range(0, len(Sizes)))
     Model.S = pyo.Set(initialize = range(0, Model.MaxShelves))
     Model.Pallets = pyo.Param(Model.P, within = pyo.NonNegativeIntegers, mutable = True)
+    Model.Count = pyo.Param(Model.P, within = pyo.NonNegativeIntegers, mutable = True)   # Number of pallets of each height
     Model.ShelfHeights = pyo.Param(Model.S, within = pyo.NonNegativeIntegers, mutable = True)
     Model.NumShelves = 0
 
     for p in Model.P:
-        Model.Pallets[p] = Pallets['Sizes'][p]
+        Model.Pallets[p] = Sizes[p]
+        Model.Count[p] = Counts[p]
     for s in Model.S:
         Model.ShelfHeights[s] = ShelfHeights[str(s+1)][case]
         if ShelfHeights[str(s+1)][case] > 0:
             Model.NumShelves += 1
+    if aggregated:   # Whether the pallets of each height fit on each shelf
+        Model.Fits = pyo.Param(Model.P, Model.S, within = pyo.Binary, mutable = True)
+        for p in Model.P:
+            for s in Model.S:
+                Model.Fits[p, s] = int(ShelfHeights[str(s+1)][case] >= Sizes[p])
     return Model
     
 # Define optimization model
 def defineModel(Model):
     Model.Racks = pyo.Var(domain = pyo.NonNegativeIntegers, initialize = 0)   # Number of racks
-    Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.Binary, initialize = 0)   # Allocation of pallets to shelves and racks
+    if aggregated:
+        Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.NonNegativeIntegers, initialize = 0)   # Number of pallets of each height allocated to each shelf
 
-    def rule_fit(Model, P):   # Each pallet must be allocated to a shelf that is at least the height of the pallet
-        return sum(Model.ShelfHeights[s] * Model.Allocation[P, s] for s in Model.S) >= Model.Pallets[P]
-    Model.PalletFits = pyo.Constraint(Model.P, rule = rule_fit)
+        def rule_fit(Model, P, S):   # Pallets can be allocated only to a shelf that is at least the height of the pallets
+            return Model.Allocation[P, S] <= Model.Count[P] * Model.Fits[P, S]
+        Model.PalletFits = pyo.Constraint(Model.P, Model.S, rule = rule_fit)
+
+        def rule_use(Model, P):   # All pallets of each height must be allocated to shelves
+            return sum(Model.Allocation[P, s] for s in Model.S) == Model.Count[P]
+        Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
+    else:
+        Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.Binary, initialize = 0)   # Allocation of pallets to shelves and racks
 
-    def rule_use(Model, P):   # Each pallet must be allocated to exactly one shelf
-        return sum(Model.Allocation[P, s] for s in Model.S) == 1
-    Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
+        def rule_fit(Model, P):   # Each pallet must be allocated to a shelf that is at least the height of the pallet
+            return sum(Model.ShelfHeights[s] * Model.Allocation[P, s] for s in Model.S) >= Model.Pallets[P]
+        Model.PalletFits = pyo.Constraint(Model.P, rule = rule_fit)
+
+        def rule_use(Model, P):   # Each pallet must be allocated to exactly one shelf
+            return sum(Model.Allocation[P, s] for s in Model.S) == 1
+        Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
 
     def rule_within(Model, S):   # Times each shelf size is allocated to a pallet must be no larger than the number of racks
         return sum(Model.Allocation[p, S] for p in Model.P) <= Model.Racks * Model.PalletsPerShelf   # Some shelves may be empty (Allocation = 0)
@@ -98,50 +134,164 @@ def defineModel(Model):
     Model.Obj = pyo.Objective(rule = rule_Obj, sense = pyo.minimize)
     return Model
 
-# Solve model
-def solveModel(Model):
+# Solve model. With a finite cutoff, HiGHS prunes any branch that can't beat the cutoff, and the solution is loaded only if it beats the cutoff
+def solveModel(Model, cutoff = np.inf):
     Solver = pyo.SolverFactory(solverName)
     Solver.options['time_limit'] = timeLimit
-    Results = Solver.solve(Model, load_solutions = loadSolution, tee = verbose)
+    if np.isfinite(cutoff):
+        Solver.options['objective_bound'] = cutoff
+    Results = Solver.solve(Model, load_solutions = loadSolution and not np.isfinite(cutoff), tee = verbose)
+    checkCutoff(Model, Results, cutoff)
     return Model, Results
 
+# Note whether a solve was cut off, having found no solution better than the cutoff. Otherwise, load the solution if the solve didn't
+def checkCutoff(Model, Results, cutoff):
+    Model.CutOff = False
+    if np.isfinite(cutoff):
+        if Results.problem.upper_bound is None or Results.problem.upper_bound >= cutoff:
+            Model.CutOff = True
+        elif loadSolution:
+            Model.solutions.load_from(Results)
+
+# Evaluate a case exactly, without a solver
+# A pallet fits on any shelf that is at least its height. So, with the shelves sorted tallest first, the pallets that are taller than shelf k+1 must be on one of shelves 1 to k
+# By Hall's condition, the allocation is feasible if and only if, for every k, those pallets fit on shelves 1 to k of the racks. So the minimum number of racks is the largest of those ceiling ratios
+def evaluateExact(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
+    palletsPerShelf = PalletsPerShelf[0].item()
+    heights = np.array([ShelfHeights[str(s+1)][case] for s in range(0, MaxShelves[0].item())])
+    shelves = np.sort(heights[heights > 0])[::-1]   # Shelves in use, tallest first
+    numShelves = len(shelves)
+    sizes = np.sort(Pallets['Sizes'].to_numpy())
+    if numShelves == 0 or sizes[-1] > shelves[0]:   # Some pallets don't fit on any shelf, so the case is infeasible
+        return np.inf, heights
+    nextShelf = np.append(shelves[1:], 0)   # Height of the next shelf down, with 0 below the shortest shelf
+    needShelves = len(sizes) - np.searchsorted(sizes, nextShelf, side = 'right')   # Pallets that must be on this shelf or a taller one
+    racks = int(np.max(-(-needShelves // (np.arange(1, numShelves + 1) * palletsPerShelf))))   # Ceiling division
+    if weightedObj:
+        Obj = WeightRacks[0].item() * racks + WeightShelves[0].item() * numShelves
+    else:
+        Obj = racks
+    return round(Obj, 4), heights
 
+# Lower bound on the objective of a case: whatever the shelf heights, each rack holds at most PalletsPerShelf pallets on each of its shelves
+def lowerBound(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
+    numShelves = sum(1 for s in range(0, MaxShelves[0].item()) if ShelfHeights[str(s+1)][case] > 0)
+    if numShelves == 0:
+        return np.inf
+    racks = -(-len(Pallets) // (PalletsPerShelf[0].item() * numShelves))   # Ceiling division
+    if weightedObj:
+        return round(WeightRacks[0].item() * racks + WeightShelves[0].item() * numShelves, 4)
+    else:
+        return racks
 
+# Set the case data in a worker, so each task uses data that was loaded once rather than reading the Excel files again
+def initWorker(data):
+    global caseData
+    caseData = data
 
+# Best objective found so far, for pruning
+def readIncumbent():
+    return incumbent
+
+def updateIncumbent(Obj):
+    global incumbent
+    incumbent = min(incumbent, Obj)
 
 # Tasks to be completed
-def tasks(case, worker):
+def tasks(case, worker, heights = None):
     startTime = datetime.now()
-    Model = pyo.ConcreteModel(name = modelName + ', Case ' + str(case + 1))
-    Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf = GetData(dataFile, dataWorksheet, casesFile, casesWorksheet)
-    DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
-    defineModel(Model)
-    Model, Results = solveModel(Model)
-    Obj = round(pyo.value(Model.Obj()), 4)
+    Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf = caseData
+    if heights is not None:   # A generated case
+        ShelfHeights = shelf_cases.caseFrame(case, heights)
+    cutoff = readIncumbent() if prune else np.inf
+    bound = lowerBound(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+    note = ''
+    if bound >= cutoff:   # The case can't beat the incumbent, so skip it
+        Obj = np.inf
+        Heights = [ShelfHeights[str(s+1)][case] for s in range(0, MaxShelves[0].item())]
+        note = f', skipped: bound {bound:,.1f} is no better than incumbent {cutoff:,.1f}'
+    elif evaluator == 'exact':
+        Obj, Heights = evaluateExact(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+    else:
+        Model = pyo.ConcreteModel(name = modelName + ', Case ' + str(case + 1))
+        DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+        defineModel(Model)
+        Model, Results = solveModel(Model, cutoff)
+        Heights = [pyo.value(Model.ShelfHeights[s]) for s in Model.S]
+        if Model.CutOff:   # The solver found no solution better than the incumbent
+            Obj = np.inf
+            note = f', cut off: no solution better than incumbent {cutoff:,.1f}'
+        else:
+            Obj = round(pyo.value(Model.Obj()), 4)
+    updateIncumbent(Obj)
     Solution = f'Case {case+1:3,.0f}, shelves = '
-    for s in Model.S:
-        Solution += f'{pyo.value(Model.ShelfHeights[s]):3,.0f}, '
-    Solution += f'obj = {Model.Obj():7,.1f}'
+    for h in Heights:
+        Solution += f'{h:3,.0f}, '
+    Solution += f'obj = {Obj:7,.1f}' + note
     endTime = datetime.now()
     print(f'Case {case:>4,.0f}   Objective: {Obj:>7,.1f}   Start time: {startTime.strftime("%H:%M:%S")}   End time: {endTime.strftime("%H:%M:%S")}   Worker: {worker:>3,.0f}')
     return Obj, Solution
 
+# Rank 0 hands out cases on demand, so a worker that finishes a quick case gets another rather than waiting for a fixed block of cases
+# Each request for a case includes the result of the worker's previous case, if any. Each case is sent with the best objective so far, for pruning. A worker is told to stop when there are no cases left
+def dispatch(comm, cases):
+    result = {}
+    status = MPI.Status()
+    nextCase = next(cases, None)
+    bestObj = np.inf
+    activeWorkers = comm.Get_size() - 1
+    while activeWorkers > 0:
+        message = comm.recv(source = MPI.ANY_SOURCE, status = status)
+        if message is not None:
+            case, Obj, Solution = message
+            result[case] = (Obj, Solution)
+            bestObj = min(bestObj, Obj)
+        if nextCase is not None:
+            comm.send((*nextCase, bestObj), dest = status.Get_source())
+            nextCase = next(cases, None)
+        else:
+            comm.send(None, dest = status.Get_source())   # Stop
+            activeWorkers -= 1
+    return [result[case] for case in sorted(result)]
+
+# Ranks 1 to n ask rank 0 for cases until there are none left
+def work(comm, worker):
+    global incumbent
+    message = None
+    while True:
+        comm.send(message, dest = 0)
+        task = comm.recv(source = 0)
+        if task is None:
+            break
+        case, heights, incumbent = task
+        Obj, Solution = tasks(case, worker, heights)
+        message = (case, Obj, Solution)
+
+# Output summary of case results
+def summaryOutput(result):
+    BestObj = np.inf
+    BestCase = ''
+    print()
+    for r in range(0, len(result)):
+        print(result[r][1])
+        currObj = round(result[r][0], 4)
+        if currObj < BestObj:
+            BestObj = currObj
+            BestCase = result[r][1]
+    print(f'\nBest case: {BestCase}')
+
 # Main
 if __name__ == '__main__':
-    dataRows = LoadFromExcel(casesFile, casesWorksheet, 'Cases')   # Get number of rack designs
-    numRows = len(dataRows)
-    worker = MPI.COMM_WORLD.Get_rank()
-    minTasksPerWorker = numRows // processesToUse   # Divide the tasks as evenly as possible between the processes. Some processes will do n tasks
-    maxTasksPerWorker = minTasksPerWorker + 1   # And some processes will do n + 1 tasks
-    plusOneWorkers = numRows - (minTasksPerWorker * processesToUse)
-    stdWorkers = plusOneWorkers - 1
-    if worker <=  stdWorkers:
-        caseFrom = worker * maxTasksPerWorker
-        caseTo = caseFrom + maxTasksPerWorker        
-        cases = range(caseFrom, caseTo)
+    comm = MPI.COMM_WORLD if MPI is not None else None
+    worker = comm.Get_rank() if comm is not None else 0
+    data = None
+    if worker == 0:
+        data = GetData(dataFile, dataWorksheet, casesFile, casesWorksheet)   # Load data once, on rank 0
+    initWorker(comm.bcast(data, root = 0) if comm is not None else data)   # Broadcast the data to all ranks
+    if processesToUse == 1:   # No other ranks, so rank 0 does all the cases itself
+        summaryOutput([tasks(case, worker, heights) for case, heights in caseList(caseData)])
+    elif worker == 0:
+        print(f'Dispatching cases to {processesToUse - 1} workers')
+        summaryOutput(dispatch(comm, caseList(caseData)))
     else:
-        caseFrom = (stdWorkers + 1) * maxTasksPerWorker + (worker - plusOneWorkers) * minTasksPerWorker
-        caseTo = caseFrom + minTasksPerWorker        
-        cases = range(caseFrom, caseTo)
-    for case in cases:
-        Obj, Solution = tasks(case, worker)
\ No newline at end of file
+        work(comm, worker)
\ No newline at end of file
@@ -6,8 +6,8 @@ from datetime import datetime
 import os as os
 import pandas as pd
 import numpy as np
-from openpyxl import load_workbook
-from openpyxl.utils.cell import range_boundaries
+import shelf_cases
+import excel_ranges
 
 
 # User selections
@@ -16,6 +16,15 @@ casesFile = os.path.join(os.getcwd() + '\data', 'ShelfCases-6-0.xlsx')
 dataWorksheet = 'Data'
 casesWorksheet = 'Data'
 weightedObj = True
+aggregated = False   # Group pallets by height, with integer allocation of each height to each shelf, so the model size doesn't depend on the number of pallets
+evaluator = 'mip'   # 'mip' = solve a MIP for each case; 'exact' = compute the same optimal objective by counting, without a solver
+prune = False   # Skip cases whose lower bound can't beat the best objective found so far, and give that objective to the solver as a cutoff
+generateCases = False   # Generate shelf cases on the fly with shelf_cases.py, using the assumptions in dataFile, rather than reading them from casesFile
+minShelves = 6   # Rules for generated cases. These settings generate the cases in ShelfCases-6-0.xlsx
+minTallest = 2   # Minimum and maximum number of shelves of the tallest height
+maxTallest = 3
+cacheData = True   # Save the data ranges in a cache file next to each workbook, so later runs don't need to open the workbooks
+sweep = False   # Build the model once, then update the shelf heights for each case and re-solve using a persistent appsi_highs solver, warm started from the previous case
 
 
 # Solver options
@@ -28,63 +37,98 @@ timeLimit = 1*3600   # per case
 
 
 # Fixed
+caseData = None   # Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf. Set by loadData
 modelName = 'Racks and shelves - Model 4 serial'
-
-# Generic loader from Excel file, given worksheet and named range
-def LoadFromExcel(excelFile, worksheet, rangeName):
-    wb = load_workbook(filename=excelFile, read_only=True)
-    ws = wb[worksheet]
-    dests = wb.defined_names[rangeName].destinations
-    for title, coord in dests:
-        min_col, min_row, max_col, max_row = range_boundaries(coord)
-        data = ws.iter_rows(min_row, max_row, min_col, max_col, values_only = True)
-    df = pd.DataFrame(data)
-    return df
+incumbent = np.inf   # Best objective found so far
+sweepModel = None   # Model and persistent solver for a sweep. Set by the first case
+sweepSolver = None
 
 # Load data from Excel file
 def GetData(dataFile, dataWorksheet, casesFile, casesWorksheet):
-    Pallets = LoadFromExcel(dataFile, dataWorksheet, 'Heights')   # List of all pallet sizes (decimetres) that we need to store os shelves
+    dataRanges = excel_ranges.loadRanges(dataFile, dataWorksheet, ['Heights', 'MaxShelves', 'WeightRacks', 'WeightShelves', 'PalletsPerShelf', 'RackHeight', 'Gap', 'MinShelfSize', 'MaxShelfSize'], cacheData)   # Open the data file once, for all ranges, including those used to generate cases
+    Pallets = dataRanges['Heights']   # List of all pallet sizes (decimetres) that we need to store os shelves
     Pallets.columns = ['Sizes']   # Name the pallets column
-    MaxShelves = LoadFromExcel(dataFile, dataWorksheet, 'MaxShelves')   # Maximum number of shelves in a rack
-    WeightRacks = LoadFromExcel(dataFile, dataWorksheet, 'WeightRacks')   # Objective function weight on the variable for number of racks
-    WeightShelves = LoadFromExcel(dataFile, dataWorksheet, 'WeightShelves')   # Objective function weight on the variable for number of shelves
-    ShelfHeights = LoadFromExcel(casesFile, casesWorksheet, 'Cases')   # Height of each shelf in each case
-    ShelfHeights.columns = [str(n).zfill(1) for n in range(1, ShelfHeights.shape[1] + 1)]   # Label columns from '1' to 'n'
-    PalletsPerShelf = LoadFromExcel(dataFile, dataWorksheet, 'PalletsPerShelf')   # Number of pallets on each shelf
+    MaxShelves = dataRanges['MaxShelves']   # Maximum number of shelves in a rack
+    WeightRacks = dataRanges['WeightRacks']   # Objective function weight on the variable for number of racks
+    WeightShelves = dataRanges['WeightShelves']   # Objective function weight on the variable for number of shelves
+    if generateCases:   # Cases come from shelf_cases.py instead
+        ShelfHeights = None
+    else:
+        ShelfHeights = excel_ranges.loadRanges(casesFile, casesWorksheet, ['Cases'], cacheData)['Cases']   # Height of each shelf in each case
+        ShelfHeights.columns = [str(n).zfill(1) for n in range(1, ShelfHeights.shape[1] + 1)]   # Label columns from '1' to 'n'
+    PalletsPerShelf = dataRanges['PalletsPerShelf']   # Number of pallets on each shelf
     return Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf
 
+# The cases to run, as (case, heights) pairs. Generated cases are yielded one at a time. For cases from casesFile, heights is None, as the heights are in the data
+def caseList(data):
+    if generateCases:
+        rules = excel_ranges.loadRanges(dataFile, dataWorksheet, ['MaxShelves', 'RackHeight', 'Gap', 'MinShelfSize', 'MaxShelfSize'], cacheData)
+        rules = [rules[rangeName][0].item() for rangeName in rules]
+        return enumerate(shelf_cases.shelfCases(*rules, data[0]['Sizes'].max(), minShelves = minShelves, minTallest = minTallest, maxTallest = maxTallest))
+    return ((case, None) for case in range(0, len(data[2])))
+
 # Define model data, assigning all data to the Model for the given case
 def DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
     Model.MaxShelves = MaxShelves[0].item()
     Model.WeightRacks = WeightRacks[0].item()
     Model.WeightShelves = WeightShelves[0].item()
     Model.PalletsPerShelf = PalletsPerShelf[0].item()
-    Model.P = pyo.Set(initialize = range(0, len(Pallets)))
+    if aggregated:   # Group pallets by height, so the size of the model doesn't depend on the number of pallets
+        Sizes, Counts = np.unique(Pallets['Sizes'], return_counts = True)
+    else:   # Each pallet separately
+        Sizes, Counts = Pallets['Sizes'].to_numpy(), np.ones(len(Pallets), dtype = int)
+    Model.P = pyo.Set(initialize = range(0, len(Sizes)))
     Model.S = pyo.Set(initialize = range(0, Model.MaxShelves))
     Model.Pallets = pyo.Param(Model.P, within = pyo.NonNegativeIntegers, mutable = True)
+    Model.Count = pyo.Param(Model.P, within = pyo.NonNegativeIntegers, mutable = True)   # Number of pallets of each height
     Model.ShelfHeights = pyo.Param(Model.S, within = pyo.NonNegativeIntegers, mutable = True)
-    Model.NumShelves = 0
+    Model.NumShelves = pyo.Param(within = pyo.NonNegativeIntegers, mutable = True, initialize = 0)   # Mutable, so a sweep can change it
+    if aggregated:   # Whether the pallets of each height fit on each shelf
+        Model.Fits = pyo.Param(Model.P, Model.S, within = pyo.Binary, mutable = True)
 
     for p in Model.P:
-        Model.Pallets[p] = Pallets['Sizes'][p]
+        Model.Pallets[p] = Sizes[p]
+        Model.Count[p] = Counts[p]
+    UpdateModelData(Model, case, ShelfHeights)
+    return Model
+
+# Assign the shelf data for the given case. In a sweep, this updates the existing model in place
+def UpdateModelData(Model, case, ShelfHeights):
+    numShelves = 0
     for s in Model.S:
         Model.ShelfHeights[s] = ShelfHeights[str(s+1)][case]
         if ShelfHeights[str(s+1)][case] > 0:
-            Model.NumShelves += 1
+            numShelves += 1
+    Model.NumShelves = numShelves
+    if aggregated:
+        for p in Model.P:
+            for s in Model.S:
+                Model.Fits[p, s] = int(ShelfHeights[str(s+1)][case] >= pyo.value(Model.Pallets[p]))
     return Model
     
 # Define optimization model
 def defineModel(Model):
     Model.Racks = pyo.Var(domain = pyo.NonNegativeIntegers, initialize = 0)   # Number of racks
-    Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.Binary, initialize = 0)   # Allocation of pallets to shelves and racks
+    if aggregated:
+        Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.NonNegativeIntegers, initialize = 0)   # Number of pallets of each height allocated to each shelf
+
+        def rule_fit(Model, P, S):   # Pallets can be allocated only to a shelf that is at least the height of the pallets
+            return Model.Allocation[P, S] <= Model.Count[P] * Model.Fits[P, S]
+        Model.PalletFits = pyo.Constraint(Model.P, Model.S, rule = rule_fit)
 
-    def rule_fit(Model, P):   # Each pallet must be allocated to a shelf that is at least the height of the pallet
-        return sum(Model.ShelfHeights[s] * Model.Allocation[P, s] for s in Model.S) >= Model.Pallets[P]
-    Model.PalletFits = pyo.Constraint(Model.P, rule = rule_fit)
+        def rule_use(Model, P):   # All pallets of each height must be allocated to shelves
+            return sum(Model.Allocation[P, s] for s in Model.S) == Model.Count[P]
+        Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
+    else:
+        Model.Allocation = pyo.Var(Model.P, Model.S, domain = pyo.Binary, initialize = 0)   # Allocation of pallets to shelves and racks
 
-    def rule_use(Model, P):   # Each pallet must be allocated to exactly one shelf
-        return sum(Model.Allocation[P, s] for s in Model.S) == 1
-    Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
+        def rule_fit(Model, P):   # Each pallet must be allocated to a shelf that is at least the height of the pallet
+            return sum(Model.ShelfHeights[s] * Model.Allocation[P, s] for s in Model.S) >= Model.Pallets[P]
+        Model.PalletFits = pyo.Constraint(Model.P, rule = rule_fit)
+
+        def rule_use(Model, P):   # Each pallet must be allocated to exactly one shelf
+            return sum(Model.Allocation[P, s] for s in Model.S) == 1
+        Model.MustUse = pyo.Constraint(Model.P, rule = rule_use)
 
     def rule_within(Model, S):   # Times each shelf size is allocated to a pallet must be no larger than the number of racks
         return sum(Model.Allocation[p, S] for p in Model.P) <= Model.Racks * Model.PalletsPerShelf   # Some shelves may be empty (Allocation = 0)
@@ -98,56 +142,156 @@ def defineModel(Model):
     Model.Obj = pyo.Objective(rule = rule_Obj, sense = pyo.minimize)
     return Model
 
-# Solve model
-def solveModel(Model):
+# Solve model. With a finite cutoff, HiGHS prunes any branch that can't beat the cutoff, and the solution is loaded only if it beats the cutoff
+def solveModel(Model, cutoff = np.inf):
     Solver = pyo.SolverFactory(solverName)
     Solver.options['time_limit'] = timeLimit
-    Results = Solver.solve(Model, load_solutions = loadSolution, tee = verbose)
+    if np.isfinite(cutoff):
+        Solver.options['objective_bound'] = cutoff
+    Results = Solver.solve(Model, load_solutions = loadSolution and not np.isfinite(cutoff), tee = verbose)
+    checkCutoff(Model, Results, cutoff)
+    return Model, Results
+
+# Note whether a solve was cut off, having found no solution better than the cutoff. Otherwise, load the solution if the solve didn't
+def checkCutoff(Model, Results, cutoff):
+    Model.CutOff = False
+    if np.isfinite(cutoff):
+        if Results.problem.upper_bound is None or Results.problem.upper_bound >= cutoff:
+            Model.CutOff = True
+        elif loadSolution:
+            Model.solutions.load_from(Results)
+
+# Solve model in a sweep, using one persistent solver for all cases. After the first case, only the mutable parameters are sent to the solver
+def solveSweep(Model, cutoff = np.inf):
+    global sweepSolver
+    if sweepSolver is None:
+        sweepSolver = pyo.SolverFactory('appsi_highs')
+        sweepSolver.options['time_limit'] = timeLimit
+        sweepSolver.update_config.check_for_new_or_removed_constraints = False   # The model structure is the same for every case
+        sweepSolver.update_config.check_for_new_or_removed_vars = False
+        sweepSolver.update_config.check_for_new_or_removed_params = False
+        sweepSolver.update_config.update_constraints = False
+        sweepSolver.update_config.update_vars = False
+        sweepSolver.update_config.update_named_expressions = False
+        sweepSolver.update_config.update_objective = False
+    sweepSolver.options['objective_bound'] = cutoff   # Set for every case, as the solver keeps its options. Infinite, HiGHS's default, unless pruning
+    Results = sweepSolver.solve(Model, load_solutions = loadSolution and not np.isfinite(cutoff), tee = verbose, warmstart = True)   # Start from the previous case's solution, where it is still feasible
+    checkCutoff(Model, Results, cutoff)
     return Model, Results
 
+# Evaluate a case exactly, without a solver
+# A pallet fits on any shelf that is at least its height. So, with the shelves sorted tallest first, the pallets that are taller than shelf k+1 must be on one of shelves 1 to k
+# By Hall's condition, the allocation is feasible if and only if, for every k, those pallets fit on shelves 1 to k of the racks. So the minimum number of racks is the largest of those ceiling ratios
+def evaluateExact(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
+    palletsPerShelf = PalletsPerShelf[0].item()
+    heights = np.array([ShelfHeights[str(s+1)][case] for s in range(0, MaxShelves[0].item())])
+    shelves = np.sort(heights[heights > 0])[::-1]   # Shelves in use, tallest first
+    numShelves = len(shelves)
+    sizes = np.sort(Pallets['Sizes'].to_numpy())
+    if numShelves == 0 or sizes[-1] > shelves[0]:   # Some pallets don't fit on any shelf, so the case is infeasible
+        return np.inf, heights
+    nextShelf = np.append(shelves[1:], 0)   # Height of the next shelf down, with 0 below the shortest shelf
+    needShelves = len(sizes) - np.searchsorted(sizes, nextShelf, side = 'right')   # Pallets that must be on this shelf or a taller one
+    racks = int(np.max(-(-needShelves // (np.arange(1, numShelves + 1) * palletsPerShelf))))   # Ceiling division
+    if weightedObj:
+        Obj = WeightRacks[0].item() * racks + WeightShelves[0].item() * numShelves
+    else:
+        Obj = racks
+    return round(Obj, 4), heights
 
 
 
 
+# Lower bound on the objective of a case: whatever the shelf heights, each rack holds at most PalletsPerShelf pallets on each of its shelves
+def lowerBound(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves):
+    numShelves = sum(1 for s in range(0, MaxShelves[0].item()) if ShelfHeights[str(s+1)][case] > 0)
+    if numShelves == 0:
+        return np.inf
+    racks = -(-len(Pallets) // (PalletsPerShelf[0].item() * numShelves))   # Ceiling division
+    if weightedObj:
+        return round(WeightRacks[0].item() * racks + WeightShelves[0].item() * numShelves, 4)
+    else:
+        return racks
+
+# Set the case data, so each case uses data that was loaded once rather than reading the Excel files again
+def loadData(data):
+    global caseData
+    caseData = data
+
+# Best objective found so far, for pruning
+def readIncumbent():
+    return incumbent
+
+def updateIncumbent(Obj):
+    global incumbent
+    incumbent = min(incumbent, Obj)
+
 # Tasks to be completed
-def tasks(case):
+def tasks(case, heights = None):
+    global sweepModel
     startTime = datetime.now()
-    Model = pyo.ConcreteModel(name = modelName + ', Case ' + str(case + 1))
-    Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf = GetData(dataFile, dataWorksheet, casesFile, casesWorksheet)
-    DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
-    defineModel(Model)
-    Model, Results = solveModel(Model)
-    Obj = round(pyo.value(Model.Obj()), 4)
+    Pallets, MaxShelves, ShelfHeights, WeightRacks, WeightShelves, PalletsPerShelf = caseData
+    if heights is not None:   # A generated case
+        ShelfHeights = shelf_cases.caseFrame(case, heights)
+    cutoff = readIncumbent() if prune else np.inf
+    bound = lowerBound(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+    note = ''
+    if bound >= cutoff:   # The case can't beat the incumbent, so skip it
+        Obj = np.inf
+        Heights = [ShelfHeights[str(s+1)][case] for s in range(0, MaxShelves[0].item())]
+        note = f', skipped: bound {bound:,.1f} is no better than incumbent {cutoff:,.1f}'
+    elif evaluator == 'exact':
+        Obj, Heights = evaluateExact(case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+    else:
+        if sweep and sweepModel is not None:   # Update the model built for the first case of the sweep
+            Model = UpdateModelData(sweepModel, case, ShelfHeights)
+        else:
+            Model = pyo.ConcreteModel(name = modelName + ', Case ' + str(case + 1))
+            DefineModelData(Model, case, Pallets, MaxShelves, ShelfHeights, PalletsPerShelf, WeightRacks, WeightShelves)
+            defineModel(Model)
+        if sweep:
+            sweepModel = Model
+            Model, Results = solveSweep(Model, cutoff)
+        else:
+            Model, Results = solveModel(Model, cutoff)
+        Heights = [pyo.value(Model.ShelfHeights[s]) for s in Model.S]
+        if Model.CutOff:   # The solver found no solution better than the incumbent
+            Obj = np.inf
+            note = f', cut off: no solution better than incumbent {cutoff:,.1f}'
+        else:
+            Obj = round(pyo.value(Model.Obj()), 4)
+    updateIncumbent(Obj)
     Solution = f'Case {case+1:3,.0f}, shelves = '
-    for s in Model.S:
-        Solution += f'{pyo.value(Model.ShelfHeights[s]):3,.0f}  '
-    Solution += f'obj = {Model.Obj():7,.1f}'
+    for h in Heights:
+        Solution += f'{h:3,.0f}  '
+    Solution += f'obj = {Obj:7,.1f}' + note
     endTime = datetime.now()
     print(f'Case {case:>3,.0f}   Objective: {Obj:>7,.1f}   Start time: {startTime.strftime("%H:%M:%S")}   End time: {endTime.strftime("%H:%M:%S")}')
     return Obj, Solution
 
 # Loop over each case, in sequence
-def loop(numRows):
+def loop(cases):
     BestObj = np.inf
     BestCase = ''
     Summary = ''
-    for case in range(0, numRows):   # Run each of the tasks
-        Obj, Solution = tasks(case)
+    numCases = 0
+    for case, heights in cases:   # Run each of the tasks
+        Obj, Solution = tasks(case, heights)
+        numCases += 1
         Summary += Solution + '\n'
         currObj = round(Obj, 4)
         if currObj < BestObj:
             BestObj = currObj
             BestCase = Solution
-    return Summary, BestCase
+    return Summary, BestCase, numCases
 
 
 # Main
 if __name__ == '__main__':
-    dataRows = LoadFromExcel(casesFile, casesWorksheet, 'Cases')   # Get number of rack designs
-    numRows = len(dataRows)
-    print(f'Number of cases: {numRows}')
-    cases = range(0, numRows)   # Define each rack design as a case
-    Summary, BestCase = loop(numRows)
+    loadData(GetData(dataFile, dataWorksheet, casesFile, casesWorksheet))   # Load data once, for all cases
+    cases = caseList(caseData)   # Define each rack design as a case
+    Summary, BestCase, numCases = loop(cases)
     print(Summary)
+    print(f'Number of cases: {numCases}')
     print(f'Best case: {BestCase}')
     
\ No newline at end of file
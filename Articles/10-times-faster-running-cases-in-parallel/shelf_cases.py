@@ -0,0 +1,33 @@
+# Racks and shelves: generate shelf cases on the fly
+# Rather than reading an enumeration of cases from a workbook like ShelfCases-6-0.xlsx, the case runners can take cases from shelfCases, which yields them one at a time
+# A case is a tuple of shelf heights, tallest first, padded with zeros to maxShelves. Each shelf uses its height plus the gap above it. The filters are:
+# - Symmetry: the order of the shelves in a rack doesn't matter, so only non-increasing tuples are generated
+# - Dominance: a taller shelf fits every pallet that a shorter shelf does. So cases with enough spare rack height to make a shelf one step taller aren't generated, and no shelf is taller than it needs to be for the tallest pallet
+# - Feasibility: the tallest shelf must fit the tallest pallet
+# With the assumptions in pallets-*.xlsx plus minShelves = 6, minTallest = 2, and maxTallest = 3, this generates the 158 cases of ShelfCases-6-0.xlsx, in the same order
+
+import pandas as pd
+
+def shelfCases(maxShelves, rackHeight, gap, minShelfSize, maxShelfSize, tallestPallet, step = 1, minShelves = 1, minTallest = 0, maxTallest = None):
+    tallest = minShelfSize + max(0, -(-(tallestPallet - minShelfSize) // step)) * step   # Shortest shelf on the grid that fits the tallest pallet
+    if tallest > maxShelfSize:   # No shelf can fit the tallest pallet
+        return
+    if maxTallest is None:
+        maxTallest = maxShelves
+    heights = range(tallest, minShelfSize - 1, -step)   # Grid of shelf heights, tallest first
+
+    def extend(case, spare):   # Cases that start with the given shelves, where spare is the rack height not yet used
+        if case[-1] < tallest and spare - (maxShelves - len(case)) * (case[-1] + gap) >= step:   # Even the most and tallest shelves allowed can't fill the rack, so every case from here is dominated
+            return
+        if len(case) < maxShelves:
+            for h in heights:
+                if h <= case[-1] and h + gap <= spare and (h < tallest or case.count(tallest) < maxTallest):
+                    yield from extend(case + [h], spare - h - gap)
+        if len(case) >= minShelves and case.count(tallest) >= minTallest and (spare < step or case[-1] == tallest):   # Otherwise the shortest shelf could be taller
+            yield tuple(case) + (0,) * (maxShelves - len(case))
+
+    if tallest + gap <= rackHeight:
+        yield from extend([tallest], rackHeight - tallest - gap)
+
+def caseFrame(case, heights):   # One case as a ShelfHeights DataFrame, with columns '1' to 'n', so the models can use it like a row of casesFile
+    return pd.DataFrame([heights], index = [case], columns = [str(s) for s in range(1, len(heights) + 1)])
@@ -0,0 +1,156 @@
+# Cabling management, Model 1b: Enumeration in parallel
+# We enumerate rack positions for the devices, like Model 1, but with four changes so that proving optimality is practical for 12 to 14 devices:
+# - The permutations are split by the devices in the first few rack positions (a prefix). Each prefix is a task for a process pool.
+# - Each task walks its subtree by placing one device at a time, so the length is updated incrementally from the cables attached to that device.
+# - A reversed rack has the same length, so only orders where the first device has a lower index than the last device are enumerated.
+# - A partial order is abandoned when a lower bound on its length is no better than the best length found by any process.
+
+import sys
+import time
+import math
+import itertools
+import multiprocessing as mp
+
+import cable_search as cs
+from cable_data import load_cable_data, index_to_letter
+
+# Data
+cable_struct = load_cable_data('data_12')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
+
+# Constants
+MAX_TIME = 3600   # Maximum overall run time, seconds
+PREFIX_LENGTH = 2   # Number of rack positions fixed in each task
+BEST_REFRESH_NODES = 10000   # Number of nodes between reads of the best length found by other processes
+
+def init_worker(best_length, adjacency):   # Give each process access to the best length found by any process, and the cable data once rather than with every task
+    global shared_best, shared_adjacency
+    shared_best = best_length
+    shared_adjacency = adjacency
+
+def search_prefix(prefix, num_devices, start_time, max_time):   # Enumerate all orders that start with the prefix. Returns best length and order found, or None, and nodes visited
+    if time.time() - start_time >= max_time:   # Skip the remaining prefixes once the time is up
+        return None, None, 0
+    adjacency = shared_adjacency
+    degree = [sum(cables for _, cables in neighbours) for neighbours in adjacency]
+    placed_cables = [0] * num_devices   # Cables from each device to the devices already placed
+    placed = [False] * num_devices
+    order = [0] * num_devices   # order[device] = position
+    state = {'cut': 0,   # Cables crossing the gap below the last placed device
+             'partial': 0,   # Length of cables in the gaps between placed devices, including the gap below the last placed device
+             'internal': sum(degree) // 2,   # Cables between unplaced devices. Each crosses at least one more gap
+             'bound': shared_best.value, 'best_order': None, 'nodes': 0}
+    first_device = prefix[0]
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), num_devices + 100))   # The search recurses once for each rack position
+
+    def place(v, position):   # Add a device to the partial order, updating the length from its own cables only
+        state['internal'] -= degree[v] - placed_cables[v]
+        state['cut'] += degree[v] - 2 * placed_cables[v]
+        state['partial'] += state['cut']
+        placed[v] = True
+        order[v] = position
+        for u, cables in adjacency[v]:
+            placed_cables[u] += cables
+
+    def remove(v):   # Undo place
+        for u, cables in adjacency[v]:
+            placed_cables[u] -= cables
+        placed[v] = False
+        state['partial'] -= state['cut']
+        state['cut'] -= degree[v] - 2 * placed_cables[v]
+        state['internal'] += degree[v] - placed_cables[v]
+
+    def extend(position):   # Depth first search over the remaining positions
+        state['nodes'] += 1
+        if state['nodes'] % BEST_REFRESH_NODES == 0:
+            state['bound'] = min(state['bound'], shared_best.value)
+            if time.time() - start_time >= max_time:
+                return False
+        if position == num_devices:
+            if state['partial'] < state['bound']:
+                state['bound'] = state['partial']
+                state['best_order'] = order[:]
+                with shared_best.get_lock():
+                    if state['partial'] < shared_best.value:
+                        shared_best.value = state['partial']
+            return True
+        candidates = [v for v in range(num_devices) if not placed[v] and (position < num_devices - 1 or v > first_device)]   # Mirror symmetry: last device is higher than the first
+        candidates.sort(key=lambda v: -placed_cables[v])   # Try devices strongly connected to the partial order first, to find good orders early
+        for v in candidates:
+            place(v, position)
+            if state['partial'] + state['internal'] < state['bound']:   # Lower bound on the length of any completion of this partial order
+                if not extend(position + 1):
+                    remove(v)
+                    return False
+            remove(v)
+        return True
+
+    for position, v in enumerate(prefix):
+        place(v, position)
+    if state['partial'] + state['internal'] < state['bound']:
+        extend(len(prefix))
+    if state['best_order'] is None:
+        return None, None, state['nodes']
+    return state['bound'], state['best_order'], state['nodes']
+
+def search_prefix_task(args):   # Unpack arguments for imap_unordered
+    return search_prefix(*args)
+
+def generate_prefixes(num_devices, prefix_length):   # Prefixes that can start an order with the first device lower than the last device
+    prefix_length = min(prefix_length, num_devices - 1)
+    return [prefix for prefix in itertools.permutations(range(num_devices), prefix_length) if prefix[0] < num_devices - 1]
+
+def print_header():    # Header for progress updates
+    print('Model 1b: Cable length management, enumeration in parallel\n')
+    print('     Time    %done     Best')
+    print('---------------------------')
+
+def print_progress(elapsed_time, min_length, pct_done):   # Print new best solution
+    print(f'{elapsed_time:>9,.2f}  {pct_done:>7,.2%}   {min_length:>4,.0f}')
+
+def run_pool(prefixes, adjacency, num_devices, num_processes, start_time):   # Establish and run the processor pool, collating results as each prefix completes
+    best_length = mp.Value('q', 2**62)   # Shared best length; starts larger than any possible length
+    min_length = float('inf')
+    best_case = []
+    done = 0
+    nodes = 0
+    with mp.Pool(processes = num_processes, initializer = init_worker, initargs = (best_length, adjacency)) as pool:
+        results = pool.imap_unordered(search_prefix_task, [(prefix, num_devices, start_time, MAX_TIME) for prefix in prefixes])
+        for length, order, prefix_nodes in results:
+            done += 1
+            nodes += prefix_nodes
+            if length is not None and length < min_length:
+                min_length = length
+                best_case = order
+                print_progress(time.time() - start_time, min_length, done / len(prefixes))
+            if time.time() - start_time >= MAX_TIME:   # Stop the pool, rather than wait for the remaining prefixes to be skipped
+                break
+    return min_length, best_case, nodes
+
+def print_results(min_length, best_case, num_devices, nodes, start_time):   # Print final results after processor pool completes
+    run_time = time.time() - start_time
+    print('---------------------------')
+    if run_time >= MAX_TIME:
+        print('\nExceeded time limit, so the solution may not be optimal')
+    print(f'\nDevices: {num_devices}')
+    print(f'Minimum length: {min_length}')
+    print('\nPosition     Device')
+    for v in range(len(best_case)):
+        curr_name = index_to_letter(best_case.index(v))
+        print(f'{v + 1:>8}    {curr_name:>7}')
+    orders = f'{math.factorial(num_devices):,.0f}' if num_devices <= 20 else f'about 10^{math.lgamma(num_devices + 1) / math.log(10):,.0f}'   # Large factorials can't be converted to float
+    print(f'\nNodes: {nodes:,.0f}, compared with {orders} orders')
+    print(f'Time: {run_time:,.2f} seconds')
+    print(f'Rate: {nodes / run_time:,.0f} nodes per second\n' if run_time else f'Rate: Undefined\n')
+
+def main():
+    start_time = time.time()
+    num_devices = cs.calculate_num_devices(cable_struct)
+    adjacency = cs.build_adjacency(cable_struct, num_devices)
+    prefixes = generate_prefixes(num_devices, PREFIX_LENGTH)
+    num_processes = mp.cpu_count()
+    print_header()
+    min_length, best_case, nodes = run_pool(prefixes, adjacency, num_devices, num_processes, start_time)
+    print_results(min_length, best_case, num_devices, nodes, start_time)
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,45 @@
 # Cabling management, Model 2: Random sample of cases
 # We search for solutions using a random sample of rack positions for the devices. The search continues for the specified time, or the number of samples, whichever occurs first.
 # The cases are divided into equal chucks for each cpu core/thread and run in parallel.
+# Each process generates and scores its random orders in blocks, using NumPy arrays rather than looping over the cable data in Python.
+# The number of orders in a block is set by a memory budget, as each order needs a row of positions and several rows of connection lengths.
+# The best solution found by any process is held in shared memory, so processes can compare against it without a round-trip to a manager process. The shared state is in cable_search.py.
+# Each process reports its progress as events to a collector in the main process, which prints updates and writes the events to a JSON lines file.
+# Each process periodically checkpoints its progress, so an interrupted run can be continued with: python Cables_Model_2_random_search_multi.py --resume
 
+import os
 import time
+import argparse
 import math
 import random
 import multiprocessing as mp
-import copy
+import numpy as np
+
+import cable_search as cs
+from cable_data import load_cable_data, edge_arrays, index_to_letter
+import cable_checkpoint as cc
+import cable_telemetry as ct
 
 # Data
-from data.data_12 import cable_struct   # Data file in the data folder, in Python format, like data.data_08.py
+cable_struct = load_cable_data('data_12')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
 
 # Constants
 MAX_TIME = 60   # Maximum overall run time, seconds
 UPDATE_INTERVAL = 5   # Time interval for printing current best solution, seconds
+OUTPUT_FOLDER = os.path.dirname(os.path.abspath(__file__))   # Folder for the telemetry and checkpoint files. By default next to this script, whatever the current folder is
+TELEMETRY_FILENAME = os.path.join(OUTPUT_FOLDER, 'Model2_telemetry.jsonl')   # File for progress events from each process
+MAX_CASES = 10**18   # Upper limit on the number of cases, so that counts for large racks can be printed
+BATCH_SIZE = 10000   # Maximum number of random orders generated and scored together in each block
+BATCH_MEMORY = 256 * 2**20   # Memory budget for each process's block of orders and its intermediate arrays, bytes
+CHECKPOINT_FOLDER = os.path.join(OUTPUT_FOLDER, 'checkpoints', 'Model_2')   # Folder for each process's checkpoint file
+CHECKPOINT_INTERVAL = 10   # Time interval for saving a checkpoint, seconds, well within MAX_TIME. None to not save checkpoints
 
-def index_to_letter(index):   # Convert number to character, 'A' is 65 in ASCII, 'a' is 97
-    return chr(ord('A') + index) if index < 26 else chr(ord('a') - 26 + index)
-    
-def calculate_num_devices(cable_structure):   # Number of devices in input data
-    return max(max(device_from, device_to) for device_from, device_to, _ in cable_structure) + 1
+def calculate_batch_size(num_devices, num_connections):   # Number of orders in each block, so that the block fits in the memory budget
+    row_bytes = 8 * (num_devices + 4 * num_connections)   # Each order, plus its gathered from and to positions, their difference, and the weighted lengths
+    return max(1, min(BATCH_SIZE, BATCH_MEMORY // row_bytes))
 
-def calculate_total_length(order, cable_structure):   # Total cable length of current solution
-    return sum(abs((order[device_from] - order[device_to]) * cables) for device_from, device_to, cables in cable_structure)
+def calculate_batch_lengths(orders, device_from, device_to, cables):   # Total cable length of each order in a (batch x devices) matrix of orders
+    return (np.abs(orders[:, device_from] - orders[:, device_to]) * cables).sum(axis=1)
 
 def print_progress(elapsed_time, min_length, pct_done, new_best):   # Print current solution, marking with asterisk if best found so far
     print(f'{elapsed_time:>9,.0f}  {pct_done:>7,.2%}   {min_length:>4,.0f}', f'*' if new_best else f'')
@@ -32,56 +49,75 @@ def print_header():    # Header for progress updates
     print('     Time    %done     Best')
     print('---------------------------')
     
-def cable_layout_chunk(start, end, cable_struct, num_devices, start_time, shared_dict, max_time):   # Each processor's chunk of the solution space
-    local_min_length = float('inf')   # Best length found by this process
-    local_best_case = []   # Best case found by this process
-    order = list(range(num_devices))
+def new_checkpoints(num_devices, num_processes, chunk_size, num_cases):   # State of each processor's chunk of the solution space, before it starts
+    return [{'worker': i, 'num_devices': num_devices, 'start': i * chunk_size, 'end': (i + 1) * chunk_size if i < num_processes - 1 else num_cases,
+             'done': i * chunk_size, 'rng_state': None, 'min_length': float('inf'), 'best_case': [], 'elapsed': 0}
+            for i in range(num_processes)]
+
+def save_progress(checkpoint, done, rng, local_min_length, local_best_case, elapsed_time):   # Checkpoint this process's progress, so the run can be resumed from here
+    checkpoint.update({'done': done, 'rng_state': rng.bit_generator.state, 'min_length': local_min_length, 'best_case': local_best_case, 'elapsed': elapsed_time})
+    cc.save_checkpoint(CHECKPOINT_FOLDER, checkpoint)
+
+def cable_layout_chunk(checkpoint, cable_struct, num_devices, start_time, max_time):   # Each processor's chunk of the solution space, continuing from its checkpoint
+    start, end, done = checkpoint['start'], checkpoint['end'], checkpoint['done']
+    local_min_length = checkpoint['min_length']   # Best length found by this process
+    local_best_case = checkpoint['best_case']   # Best case found by this process
+    if local_best_case and cs.update_incumbent(local_min_length, local_best_case):   # Restore the best solution found before the checkpoint
+        ct.report_incumbent(local_min_length)
+    device_from, device_to, cables = edge_arrays(cable_struct)   # Memory-mapped for a .npz data file, so processes share the data
+    max_batch_size = calculate_batch_size(num_devices, len(cables))
+    rng = np.random.default_rng(random.getrandbits(64))   # Independent random generator for each process, seeded from random so that a seeded run can be repeated
+    if checkpoint['rng_state'] is not None:
+        rng.bit_generator.state = checkpoint['rng_state']   # Continue the sequence of random orders, so a resumed process doesn't repeat the blocks it has done
+    base_orders = np.tile(np.arange(num_devices), (max_batch_size, 1))   # Identity orders, shuffled row by row to create each block
     last_update = time.time()
+    last_checkpoint = time.time()
+    reported = done   # Cases included in progress events so far
     
-    for done in range(start, end):
-        random.shuffle(order)   # Create a random device order
-        length = calculate_total_length(order, cable_struct)
+    while done < end:
+        batch_size = min(max_batch_size, end - done)
+        orders = rng.permuted(base_orders[:batch_size], axis=1)   # Create a block of random device orders
+        lengths = calculate_batch_lengths(orders, device_from, device_to, cables)
+        done += batch_size
         
-        if length < local_min_length:
-            local_best_case = copy.deepcopy(order)   # Need deep copy as order is shuffled in place 
-            local_min_length = length
+        best_row = int(np.argmin(lengths))
+        if lengths[best_row] < local_min_length:
+            local_best_case = orders[best_row].tolist()
+            local_min_length = int(lengths[best_row])
+            if cs.update_incumbent(local_min_length, local_best_case):   # Update best solution found so far, as soon as it is found
+                ct.report_incumbent(local_min_length)
 
         current_time = time.time()
-        if current_time - last_update >= UPDATE_INTERVAL:   # At some interval, co-ordinate with other processes to note progress. Multiple processes may print an update
-            with shared_dict['lock']:
-                pct_done = (done - start) / (end - start)
-                if local_min_length < shared_dict['min_length']:   # Update best solution found so far (note <)
-                    shared_dict['new_best'] = True
-                    shared_dict['min_length'] = local_min_length
-                    shared_dict['best_case'] = local_best_case
-                    shared_dict['pct_done'] = pct_done
-                if (local_min_length <= shared_dict['min_length']) and (pct_done >= shared_dict['last_pct_done']):   # Print progress, even if no improvement (note <=)
-                    elapsed_time = current_time - start_time
-                    shared_dict['last_pct_done'] = pct_done
-                    print_progress(elapsed_time, local_min_length, pct_done, shared_dict['new_best'])
-                    shared_dict['new_best'] = False
-            last_update += UPDATE_INTERVAL   # Defer updating until next regular update time
+        if current_time - last_update >= ct.TELEMETRY_INTERVAL:   # At some interval, report progress to the collector, which prints updates
+            ct.report_progress(done - reported)
+            reported = done
+            last_update += ct.TELEMETRY_INTERVAL   # Defer reporting until next regular time
+
+        if CHECKPOINT_INTERVAL is not None and current_time - last_checkpoint >= CHECKPOINT_INTERVAL:
+            save_progress(checkpoint, done, rng, local_min_length, local_best_case, current_time - start_time)
+            last_checkpoint = current_time
         
         if (current_time - start_time) >= max_time:   # Stop search if reached maximum overall run time
             break
-    return local_min_length, local_best_case, done - start + 1
-
-def run_pool(num_devices, num_processes, chunk_size, num_cases, cable_struct, start_time):   # Establish and run the processor pool
-    with mp.Manager() as manager:
-        shared_dict = manager.dict()   # Data structure shared by the processors, to capture current best state
-        shared_dict['min_length'] = float('inf')
-        shared_dict['best_case'] = list(range(num_devices))
-        shared_dict['pct_done'] = 0
-        shared_dict['last_pct_done'] = 0
-        shared_dict['new_best'] = False
-        shared_dict['lock'] = manager.Lock()
-
-        pool = mp.Pool(processes = num_processes)
-        results = [pool.apply_async(cable_layout_chunk, (i * chunk_size,
-                                                        ((i + 1) * chunk_size if i < num_processes - 1 else num_cases),
-                                                        cable_struct, num_devices, start_time, shared_dict, MAX_TIME))
-                                                        for i in range(num_processes)]
+    ct.report_progress(done - reported)   # Include cases since the last progress event
+    if CHECKPOINT_INTERVAL is not None:
+        save_progress(checkpoint, done, rng, local_min_length, local_best_case, time.time() - start_time)
+    return local_min_length, local_best_case, done - start
+
+def run_pool(num_devices, num_processes, chunk_size, num_cases, cable_struct, start_time, checkpoints=None):   # Establish and run the processor pool, from checkpoints if resuming
+    state = cs.create_shared_state(num_devices)
+    if checkpoints is None:
+        checkpoints = new_checkpoints(num_devices, num_processes, chunk_size, num_cases)
+    events = ct.create_queue()
+    collector = ct.Collector(events, start_time, UPDATE_INTERVAL, lambda elapsed_time, count: count / num_cases, print_progress, TELEMETRY_FILENAME,
+                             initial_count = sum(checkpoint['done'] - checkpoint['start'] for checkpoint in checkpoints)).start()   # Include cases from before the checkpoint
+    with mp.Pool(processes = num_processes, initializer = cs.init_worker, initargs = (state, events)) as pool:
+        results = [pool.apply_async(cable_layout_chunk, (checkpoint, cable_struct, num_devices, start_time, MAX_TIME))
+                                    for checkpoint in checkpoints]
         results = [res.get() for res in results]   # Collate results from each process
+        pool.close()
+        pool.join()   # Let the processes exit normally, so their last events reach the collector
+    collector.stop()
     return results
     
 def print_results(results, num_devices, num_cases, start_time):   # Print final results after processor pool completes
@@ -96,14 +132,32 @@ def print_results(results, num_devices, num_cases, start_time):   # Print final
     print(f'Time: {run_time:,.2f} seconds')
     print(f'Rate: {done / run_time:,.0f} cases per second\n' if run_time else f'Rate: Undefined\n')
 
+def parse_arguments():   # Command line options
+    parser = argparse.ArgumentParser(description='Model 2: Cable length management, random sample in parallel')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted run from its last checkpoint')
+    return parser.parse_args()
+
 def main():
     start_time = time.time()
-    num_devices = calculate_num_devices(cable_struct)
-    num_cases = math.factorial(num_devices)  # Arbitrary number probably large enough to find a good solution
+    args = parse_arguments()
+    num_devices = cs.calculate_num_devices(cable_struct)
+    num_cases = min(math.factorial(num_devices), MAX_CASES)  # Arbitrary number probably large enough to find a good solution
     num_processes = mp.cpu_count()
     chunk_size = num_cases // num_processes
+    checkpoints = None
+    if args.resume:
+        checkpoints = cc.load_checkpoints(CHECKPOINT_FOLDER)
+        if not checkpoints or checkpoints[0]['num_devices'] != num_devices:
+            print(f'No checkpoint for this data in {CHECKPOINT_FOLDER}')
+            return
+        start_time -= max(checkpoint['elapsed'] for checkpoint in checkpoints)   # Continue the run's time from the checkpoint
+        num_cases = checkpoints[-1]['end']
+    else:
+        cc.clear_checkpoints(CHECKPOINT_FOLDER)
     print_header()
-    results = run_pool(num_devices, num_processes, chunk_size, num_cases, cable_struct, start_time)
+    if checkpoints:
+        print(f'Resumed from checkpoint at {time.time() - start_time:,.0f} seconds')
+    results = run_pool(num_devices, num_processes, chunk_size, num_cases, cable_struct, start_time, checkpoints)
     print_results(results, num_devices, num_cases, start_time)
 
 if __name__ == "__main__":
@@ -1,31 +1,46 @@
 # Cabling management, Model 3: Local search
 # We search for solutions by starting with a random sample of rack positions for the devices, then randomly swap two device positions. We retain the new solution if it is better. To provide variety, a new random order has a probability of being created at a specified interval. The search continues for the specified time.
 # The search is run in parallel on each cpu core/thread.
+# Each swap is scored incrementally, using only the cables attached to the two swapped devices, and applied in place if it is an improvement.
+# The best solution found by any process is held in shared memory, so processes can compare against it without a round-trip to a manager process. The shared state is in cable_search.py.
+# Each process reports its progress as events to a collector in the main process, which prints updates and writes the events to a JSON lines file.
+# Each process periodically checkpoints its progress, so an interrupted run can be continued with: python Cables_Model_3_local_search.py --resume
 
+import os
 import time
-import math
+import argparse
 import random
 import multiprocessing as mp
-import copy
+
+import cable_search as cs
+from cable_data import load_cable_data, index_to_letter
+import cable_checkpoint as cc
+import cable_telemetry as ct
 
 # Data
-from data.data_08 import cable_struct   # Data file in the data folder, in Python format, like data.data_08.py
+cable_struct = load_cable_data('data_08')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
 
 # Constants
 MAX_TIME = 60   # Maximum overall run time, seconds
 MAX_TIME_BUFFER = 1   # Small buffer to allow final iteration of results to print, seconds
 UPDATE_INTERVAL = 5   # Time interval for printing current best solution, seconds
+OUTPUT_FOLDER = os.path.dirname(os.path.abspath(__file__))   # Folder for the telemetry and checkpoint files. By default next to this script, whatever the current folder is
+TELEMETRY_FILENAME = os.path.join(OUTPUT_FOLDER, 'Model3_telemetry.jsonl')   # File for progress events from each process
 RESTART_INTERVAL = 10   # Time interval for restarting each process, seconds
 RESTART_PROBABILITY = 0.5  # Probability of a thread restarting with a random order at each restart interval
+CHECKPOINT_FOLDER = os.path.join(OUTPUT_FOLDER, 'checkpoints', 'Model_3')   # Folder for each process's checkpoint file
+CHECKPOINT_INTERVAL = 10   # Time interval for saving a checkpoint, seconds, well within MAX_TIME. None to not save checkpoints
 
-def index_to_letter(index):   # Convert number to character, 'A' is 65 in ASCII, 'a' is 97
-    return chr(ord('A') + index) if index < 26 else chr(ord('a') - 26 + index)
-    
-def calculate_num_devices(cable_structure):   # Number of devices in input data
-    return max(max(device_from, device_to) for device_from, device_to, _ in cable_structure) + 1
-
-def calculate_total_length(order, cable_structure):   # Total cable length of current solution
-    return sum(abs((order[device_from] - order[device_to]) * cables) for device_from, device_to, cables in cable_structure)
+def calculate_swap_delta(order, adjacency, i, j):   # Change in total cable length if devices i and j swap positions. Cables between i and j don't change length
+    pos_i, pos_j = order[i], order[j]
+    delta = 0
+    for k, cables in adjacency[i]:
+        if k != j:
+            delta += cables * (abs(pos_j - order[k]) - abs(pos_i - order[k]))
+    for k, cables in adjacency[j]:
+        if k != i:
+            delta += cables * (abs(pos_i - order[k]) - abs(pos_j - order[k]))
+    return delta
 
 def print_progress(elapsed_time, min_length, pct_done, new_best):   # Print current solution, marking with asterisk if best found so far
     print(f'{elapsed_time:>9,.0f}  {pct_done:>7,.2%}   {min_length:>4,.0f}', f'*' if new_best else f'')
@@ -35,74 +50,99 @@ def print_header():    # Header for progress updates
     print('     Time    %done     Best')
     print('---------------------------')
     
-def local_search_chunk(cable_struct, num_devices, start_time, shared_dict, max_time):   # Each processor's chunk of the search
-    local_min_length = float('inf')   # Best length found by this process
-    local_best_case = []   # Best case found by this process
-    order = list(range(num_devices))
-    random.shuffle(order)
-    min_length = calculate_total_length(order, cable_struct)
+def new_checkpoints(num_devices, num_processes):   # State of each processor's search, before it starts
+    return [{'worker': i, 'num_devices': num_devices, 'rng_state': None, 'order': None, 'min_length': None, 'best_case': None, 'count': 0, 'elapsed': 0}
+            for i in range(num_processes)]
+
+def save_progress(checkpoint, order, min_length, local_best_case, worker_count, elapsed_time):   # Checkpoint this process's progress, so the run can be resumed from here
+    checkpoint.update({'rng_state': random.getstate(), 'order': order[:], 'min_length': min_length, 'best_case': local_best_case,
+                       'count': worker_count, 'elapsed': elapsed_time})
+    cc.save_checkpoint(CHECKPOINT_FOLDER, checkpoint)
+
+def local_search_chunk(checkpoint, cable_struct, num_devices, start_time, max_time):   # Each processor's chunk of the search, continuing from its checkpoint
+    adjacency = cs.build_adjacency(cable_struct, num_devices)
+    if checkpoint['rng_state'] is None:
+        order = list(range(num_devices))
+        random.shuffle(order)
+        length = cs.calculate_total_length(order, cable_struct)   # Length of the current order
+        min_length = length   # Best length found by this process
+        local_best_case = order[:]   # Best case found by this process
+        if cs.update_incumbent(min_length, local_best_case):   # Publish the starting order, so a restart from the shared best solution never reads the empty placeholder
+            ct.report_incumbent(min_length)
+    else:
+        random.setstate(checkpoint['rng_state'])   # Continue the sequence of random moves, so a resumed process doesn't repeat the moves it has made
+        order = checkpoint['order']
+        length = cs.calculate_total_length(order, cable_struct)
+        min_length = checkpoint['min_length']
+        local_best_case = checkpoint['best_case']
+        if cs.update_incumbent(min_length, local_best_case):   # Restore the best solution found before the checkpoint
+            ct.report_incumbent(min_length)
+    worker_count = checkpoint['count']   # Moves evaluated by this process, including before the checkpoint
     last_update = time.time()
     last_restart = time.time()
-    local_count = 0
+    last_checkpoint = time.time()
+    local_count = 0   # Moves evaluated, accepted, and restarts since the last progress event
+    accepted = 0
+    restarts = 0
     
     while time.time() - start_time < max_time + MAX_TIME_BUFFER:
-        new_order = copy.deepcopy(order[:])
         i, j = random.sample(range(num_devices), 2)
-        new_order[i], new_order[j] = new_order[j], new_order[i]
-        new_length = calculate_total_length(new_order, cable_struct)
-        if new_length < min_length:
-            order = copy.deepcopy(new_order)
-            local_best_case = copy.deepcopy(new_order)
-            min_length = new_length
+        delta = calculate_swap_delta(order, adjacency, i, j)
+        if delta < 0:   # Apply the swap in place only if it is an improvement
+            order[i], order[j] = order[j], order[i]
+            length += delta
+            accepted += 1
+            if length < min_length:
+                local_best_case = order[:]
+                min_length = length
+                if cs.update_incumbent(min_length, local_best_case):   # Update best solution found so far, as soon as it is found
+                    ct.report_incumbent(min_length)
 
         local_count += 1
         current_time = time.time()
-        if current_time - last_update >= UPDATE_INTERVAL:   # At some interval, co-ordinate with other processes to note progress. Multiple processes may print an update
-            with shared_dict['lock']:
-                elapsed_time = current_time - start_time
-                pct_done = elapsed_time / max_time
-                if min_length < shared_dict['min_length']:   # Update best solution found so far (note <)
-                    shared_dict['new_best'] = True
-                    shared_dict['min_length'] = min_length
-                    shared_dict['best_case'] = local_best_case
-                    shared_dict['pct_done'] = pct_done
-                if (min_length <= shared_dict['min_length']) and (pct_done >= shared_dict['last_pct_done']):   # Print progress, even if no improvement (note <=)
-                    shared_dict['last_pct_done'] = pct_done
-                    print_progress(elapsed_time, min_length, pct_done, shared_dict['new_best'])
-                    shared_dict['new_best'] = False
-                shared_dict['total_count'] += local_count
-                local_count = 0
-            last_update += UPDATE_INTERVAL   # Defer updating until next regular update time
+        if current_time - last_update >= ct.TELEMETRY_INTERVAL:   # At some interval, report progress to the collector, which prints updates
+            ct.report_progress(local_count, accepted, restarts)
+            worker_count += local_count
+            local_count = accepted = restarts = 0
+            last_update += ct.TELEMETRY_INTERVAL   # Defer reporting until next regular time
+
+        if CHECKPOINT_INTERVAL is not None and current_time - last_checkpoint >= CHECKPOINT_INTERVAL:
+            save_progress(checkpoint, order, min_length, local_best_case, worker_count + local_count, current_time - start_time)
+            last_checkpoint = current_time
         
         current_time = time.time()
         if current_time - last_restart >= RESTART_INTERVAL:   # Potentially restart with a new random order every RESTART_INTERVAL seconds
             if random.random() <= RESTART_PROBABILITY:
                 random.shuffle(order)
+                length = cs.calculate_total_length(order, cable_struct)   # Full rescore only when the order is replaced
             else:
-                order = copy.deepcopy(shared_dict['best_case'])
+                length, order = cs.read_incumbent()   # Continue from the best solution found by any process
+            restarts += 1
             last_restart = current_time
         
         if (current_time - start_time) >= max_time + MAX_TIME_BUFFER:   # Stop search if reached maximum overall run time
             break
-    return min_length, order
+    ct.report_progress(local_count, accepted, restarts)   # Include moves since the last progress event
+    worker_count += local_count
+    if CHECKPOINT_INTERVAL is not None:
+        save_progress(checkpoint, order, min_length, local_best_case, worker_count, time.time() - start_time)
+    return min_length, local_best_case
 
-def run_pool(num_devices, num_processes, cable_struct, start_time):   # Establish and run the processor pool
-    with mp.Manager() as manager:
-        shared_dict = manager.dict()   # Data structure shared by the processors, to capture current best state
-        shared_dict['min_length'] = float('inf')
-        shared_dict['best_case'] = list(range(num_devices))
-        shared_dict['pct_done'] = 0
-        shared_dict['last_pct_done'] = 0
-        shared_dict['new_best'] = False
-        shared_dict['total_count'] = 0
-        shared_dict['lock'] = manager.Lock()
-
-        pool = mp.Pool(processes = num_processes)
-        results = [pool.apply_async(local_search_chunk, (cable_struct, num_devices, start_time, shared_dict, MAX_TIME))
-                                    for _ in range(num_processes)]
+def run_pool(num_devices, num_processes, cable_struct, start_time, checkpoints=None):   # Establish and run the processor pool, from checkpoints if resuming
+    state = cs.create_shared_state(num_devices)
+    if checkpoints is None:
+        checkpoints = new_checkpoints(num_devices, num_processes)
+    events = ct.create_queue()
+    collector = ct.Collector(events, start_time, UPDATE_INTERVAL, lambda elapsed_time, count: elapsed_time / MAX_TIME, print_progress, TELEMETRY_FILENAME,
+                             initial_count = sum(checkpoint['count'] for checkpoint in checkpoints)).start()   # Include moves from before the checkpoint
+    with mp.Pool(processes = num_processes, initializer = cs.init_worker, initargs = (state, events)) as pool:
+        results = [pool.apply_async(local_search_chunk, (checkpoint, cable_struct, num_devices, start_time, MAX_TIME))
+                                    for checkpoint in checkpoints]
         results = [res.get() for res in results]   # Collate results from each process
-        order_count = shared_dict['total_count']   # Retrieve the total order count before it is lost when the threads end
-    return results, order_count
+        pool.close()
+        pool.join()   # Let the processes exit normally, so their last events reach the collector
+    collector.stop()
+    return results, collector.total_count
     
 def print_results(results, num_devices, total_count, start_time):   # Print final results after processor pool completes
     min_length = min(res[0] for res in results)
@@ -114,12 +154,29 @@ def print_results(results, num_devices, total_count, start_time):   # Print fina
     print(f'Rate: {total_count/run_time:,.0f} orders per second')
     print(f'Time: {run_time:,.2f} seconds')
 
+def parse_arguments():   # Command line options
+    parser = argparse.ArgumentParser(description='Model 3: Cable length management, local search in parallel')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted run from its last checkpoint')
+    return parser.parse_args()
+
 def main():
     start_time = time.time()
-    num_devices = calculate_num_devices(cable_struct)
+    args = parse_arguments()
+    num_devices = cs.calculate_num_devices(cable_struct)
     num_processes = mp.cpu_count()
+    checkpoints = None
+    if args.resume:
+        checkpoints = cc.load_checkpoints(CHECKPOINT_FOLDER)
+        if not checkpoints or checkpoints[0]['num_devices'] != num_devices:
+            print(f'No checkpoint for this data in {CHECKPOINT_FOLDER}')
+            return
+        start_time -= max(checkpoint['elapsed'] for checkpoint in checkpoints)   # Continue the run's time from the checkpoint
+    else:
+        cc.clear_checkpoints(CHECKPOINT_FOLDER)
     print_header()
-    results, total_count = run_pool(num_devices, num_processes, cable_struct, start_time)
+    if checkpoints:
+        print(f'Resumed from checkpoint at {time.time() - start_time:,.0f} seconds')
+    results, total_count = run_pool(num_devices, num_processes, cable_struct, start_time, checkpoints)
     print_results(results, num_devices, total_count, start_time)
 
 if __name__ == "__main__":
@@ -5,9 +5,12 @@ from ortools.sat.python import cp_model
 import pandas as pd
 import time as time
 from threading import Timer
+import random
+import cable_search as cs
+from cable_data import load_cable_data, index_to_letter
 
 # Data
-from data.data_12 import *   # Data file, in Python format, like data_08.py
+cable_struct = load_cable_data('data_12')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
 
 # Globals
 MODEL_NAME = 'Model 4: Cable length management, OR-Tools constraint programming'
@@ -15,20 +18,44 @@ MAX_TIME = 30   # seconds. Maximum time for each phase separately
 MAX_NO_IMPROVEMENT = 3600   # seconds. Stop if no improvement; only for Phase 1
 WORKERS = 24   # Number of parallel workers to use in Phase 1 (Phase 2 is always single-threaded). **** Change to match the number of threads on your PC
 SEARCH_ALL = False   # Search for all solutions with objective function value found in Phase 1
+USE_HINT = True   # Run a short local search before Phase 1, and give its best layout to the solver as a hint
+HINT_TIME = 5   # seconds. Time for the local search that creates the hint
+BREAK_SYMMETRY = True   # A reversed rack has the same length, so require device A to be above the last device. Phase 2 then finds one of each mirrored pair
 
 # Data
 def get_data():
     num_connections = len(cable_struct)   # Number of connections between devices. Each connection may have more than one cable
     num_devices = 0   # Number of devices in the rack
     max_cables = 0   # Maximum cables between any two devices
-    length_lb = 0   # Total cable length if all cables are of length 1
     for device_from, device_to, cables in cable_struct:
         num_devices = max(num_devices, device_from, device_to)
         max_cables = max(max_cables, cables)
-        length_lb += cables
     num_devices += 1
     max_diff = max_cables * (num_devices - 1)  # Maximum distance between devices * maximum number of cables
-    return num_connections, num_devices, max_diff, length_lb
+    return num_connections, num_devices, max_diff
+
+def device_length_bounds(cable_struct, num_devices):   # Lower bound on total length of the cables attached to each device
+    neighbour_cables = [dict() for _ in range(num_devices)]   # Connections between the same pair of devices are combined, as the other device has one position
+    for device_from, device_to, cables in cable_struct:
+        neighbour_cables[device_from][device_to] = neighbour_cables[device_from].get(device_to, 0) + cables
+        neighbour_cables[device_to][device_from] = neighbour_cables[device_to].get(device_from, 0) + cables
+    bounds = []
+    for d in range(num_devices):   # At best, the two most connected neighbours are at distance 1, the next two at distance 2, etc
+        weights = sorted(neighbour_cables[d].values(), reverse=True)
+        bounds.append(sum(cables * (i // 2 + 1) for i, cables in enumerate(weights)))
+    return bounds
+
+def local_search_hint(cable_struct, num_devices):   # Short tabu search, to create a good layout for the solver to start from
+    search = cs.LayoutSearch(cable_struct, num_devices, ('swap', 'insert', 'reverse'), HINT_TIME)
+    order = list(range(num_devices))
+    random.shuffle(order)
+    search.reset(order)
+    search.tabu(time.time() + HINT_TIME, 10, 50)
+    order = search.best_order
+    if BREAK_SYMMETRY and order[0] > order[num_devices - 1]:   # Use the mirror image, so the hint satisfies the symmetry breaking constraint
+        order = [num_devices - 1 - p for p in order]
+    print(f'Hint from {HINT_TIME} second local search: length {search.best_length}\n')
+    return order
 
 # Printing
 def print_heading(MODEL_NAME):
@@ -39,10 +66,11 @@ def print_heading(MODEL_NAME):
     print('--------------------------------------')
     
 class IntermediateSolutionPrinter(cp_model.CpSolverSolutionCallback):   # Print intermediate solutions and stop if no improvement for n seconds
-    def __init__(self, variables):
+    def __init__(self, variables, phase_1):
         cp_model.CpSolverSolutionCallback.__init__(self)
         super().__init__()
         self.__variables = variables
+        self.__phase_1 = phase_1
         self.__solution_count = 0
         self.__start_time: float = time.time()
        
@@ -66,7 +94,7 @@ class IntermediateSolutionPrinter(cp_model.CpSolverSolutionCallback):   # Print
         self._timer.start()
 
     def stop_search(self):
-        if phase_1:   # Interrupt applies only to Phase 1
+        if self.__phase_1:   # Interrupt applies only to Phase 1
             print(f'\n{self._timer_limit} seconds without improvement')
             super().stop_search()
         else:
@@ -84,7 +112,7 @@ def print_solution(status, solver, model, position, length, connection_list, dev
         for i in device_list:
             for m in device_list:
                 if solver.Value(position[m]) == i:
-                    curr_name = chr(m + ord('A'))   # Assumes devices are named A, B, C, etc
+                    curr_name = index_to_letter(m)
                     print(f'{solver.Value(position[m]) + 1:>8}    {curr_name:>7}')
         print('\nConnection    Length')
         for c in connection_list:
@@ -107,7 +135,7 @@ class VarArraySolutionPrinter(cp_model.CpSolverSolutionCallback):
             for m in range(len(self.__variables[0])):
                 v = self.Value(self.__variables[0][m])
                 if v == i:
-                    curr_name = chr(m + ord('A'))   # Assumes devices are named A, B, C, etc
+                    curr_name = index_to_letter(m)
                     print(f'{v + 1:>8}    {curr_name:>7}')        
         print()
 
@@ -115,7 +143,7 @@ class VarArraySolutionPrinter(cp_model.CpSolverSolutionCallback):
         return self.__solution_count
 
 # Formulation
-def formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best, length_lb):
+def formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best, hint=None):
     model = cp_model.CpModel()
 
     connection_list = pd.RangeIndex(num_connections)
@@ -128,7 +156,21 @@ def formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, b
     for i, (device_from, device_to, cables) in enumerate(cable_struct):    # Cable length between devices
         model.AddAbsEquality(length[i], (position[device_from] - position[device_to]) * cables)   # Note the absolute value used for calculating length
 
-    model.Add(sum(length) >= length_lb)   # Additional constraint, lower bound if all lengths are 1
+    device_lb = device_length_bounds(cable_struct, num_devices)
+    for d in device_list:   # Additional constraints, lower bound on the length of the cables attached to each device
+        attached = [length[i] for i, (device_from, device_to, _) in enumerate(cable_struct) if d in (device_from, device_to)]
+        if attached:
+            model.Add(sum(attached) >= device_lb[d])
+    model.Add(2 * sum(length) >= sum(device_lb))   # Each cable is attached to two devices. Stronger than the bound if all lengths are 1
+
+    if BREAK_SYMMETRY and num_devices > 1:
+        model.Add(position[0] < position[num_devices - 1])   # Exclude mirror images of each layout
+
+    if hint is not None:   # Suggested starting solution
+        for d in device_list:
+            model.AddHint(position[d], hint[d])
+        for i, (device_from, device_to, cables) in enumerate(cable_struct):
+            model.AddHint(length[i], abs(hint[device_from] - hint[device_to]) * cables)
     
     if phase_1:
         model.Minimize(sum(length))   # In Phase 1, minimize the total cable length
@@ -139,22 +181,23 @@ def formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, b
 
 # Find minimum cable length
 def find_min_length(MODEL_NAME, phase_1, best):
-    num_connections, num_devices, max_diff, length_lb = get_data()
-    model, position, length, connection_list, device_list = formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best, length_lb)
+    num_connections, num_devices, max_diff = get_data()
+    print_heading(MODEL_NAME)
+    hint = local_search_hint(cable_struct, num_devices) if USE_HINT else None
+    model, position, length, connection_list, device_list = formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best, hint)
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = MAX_TIME
     solver.parameters.num_workers = WORKERS
-    solution_printer = IntermediateSolutionPrinter([position, length])
-    print_heading(MODEL_NAME)
+    solution_printer = IntermediateSolutionPrinter([position, length], phase_1)
     status = solver.Solve(model, solution_printer)
     print_solution(status, solver, model, position, length, connection_list, device_list)
     best = solver.ObjectiveValue()
     return best
 
 # Search for all solutions
-def search_for_all(best):   # Search for all solutions with objective equal to solution found above
-    num_connections, num_devices, max_diff, length_lb = get_data()
-    model, position, length, connection_list, device_list = formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best, length_lb)
+def search_for_all(best, phase_1):   # Search for all solutions with objective equal to solution found above
+    num_connections, num_devices, max_diff = get_data()
+    model, position, length, connection_list, device_list = formulation(cable_struct, num_connections, num_devices, max_diff, phase_1, best)
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = MAX_TIME
 
@@ -166,15 +209,21 @@ def search_for_all(best):   # Search for all solutions with objective equal to s
 
     print('Status = %s' % solver.StatusName(status))
     print('Number of solutions found: %i' % solution_printer_all.solution_count())
+    if BREAK_SYMMETRY:
+        print('Mirror images are excluded, so the total number of solutions is twice this number')
     print(f'Run time:  {solver.WallTime():,.2f} seconds\n')
 
-# Phase 1: Find the minimum cable length
-phase_1 = True
-best = None
-best = find_min_length(MODEL_NAME, phase_1, best)
-phase_1 = False
+def main():
+    # Phase 1: Find the minimum cable length
+    phase_1 = True
+    best = None
+    best = find_min_length(MODEL_NAME, phase_1, best)
+    phase_1 = False
+
+    # Phase 2. Find all solutions with the minimum cable length found in Phase 1
+    if SEARCH_ALL:
+        best = int(best)
+        search_for_all(best, phase_1)
 
-# Phase 2. Find all solutions with the minimum cable length found in Phase 1
-if SEARCH_ALL:
-    best = int(best)
-    search_for_all(best)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
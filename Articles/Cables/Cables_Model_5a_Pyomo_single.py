@@ -2,9 +2,11 @@
 
 # Import dependencies
 import pyomo.environ as pyo
+from pyomo.core.expr.numeric_expr import LinearExpression
+from cable_data import load_cable_data, index_to_letter
 
 # Data
-from data.data_08 import *   # Data file, in Python format, like data_08.py
+cable_struct = load_cable_data('data_08')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
 cable_struct = [sorted(row[:2]) + [row[2]] for row in cable_struct]   # Sort the devices in ascending order
 
 # File assumptions
@@ -50,86 +52,53 @@ def get_data():   # Get data from data file
     return num_connections, num_devices, max_diff, length_lb
     
 def define_model_data(model, num_connections, num_devices, max_diff, length_lb):   # Define model data, assigning all data to the Model
+    connection_cables = {}   # Cables between each connected pair of devices. Duplicate connections are combined
+    for device_from, device_to, cables in cable_struct:
+        connection_cables[device_from, device_to] = connection_cables.get((device_from, device_to), 0) + cables
     model.Position = pyo.Set(initialize=range(num_devices))   # Position of device in rack
-    model.Cables = pyo.Param(model.Position, model.Position, within=pyo.NonNegativeIntegers, initialize=0, mutable=True)   # Number of cables between devices
+    model.Connections = pyo.Set(initialize=sorted(connection_cables), dimen=2)   # Connected pairs of devices, with device_from < device_to
+    model.Cables = pyo.Param(model.Connections, within=pyo.NonNegativeIntegers, initialize=connection_cables)   # Number of cables between connected devices
     model.NumConnections = num_connections
     model.NumDevices = num_devices
     model.MaxDiff = max_diff
     model.LengthLB = length_lb
     
-    for device_from, device_to, cables in cable_struct:
-        model.Cables[device_from, device_to] = cables
-    
     return model
 
-def define_model(model):   # Define the model as a Mixed Integer Linear Program
+def define_model(model):   # Define the model as a Mixed Integer Linear Program. Lengths are defined only for connected pairs of devices
     model.Allocation = pyo.Var(model.Position, within=pyo.NonNegativeIntegers, bounds=(0, model.NumDevices - 1), initialize=0)   # Position of device in rack
     model.AllDiff = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Make each rack position unique
-    model.AbsLength = pyo.Var(model.Position, model.Position, within=pyo.NonNegativeIntegers, bounds=(0, model.NumDevices - 1), initialize=0)   # Absolute value of cable length
-    model.d1 = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Helper for calculation of absolute value
-    model.d2 = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Helper for calculation of absolute value
+    model.AbsLength = pyo.Var(model.Connections, within=pyo.NonNegativeIntegers, bounds=(1, model.NumDevices - 1), initialize=1)   # Absolute value of cable length. Devices are in different positions, so at least 1
     
+    positions = list(model.Position)
+    connections = list(model.Connections)
+
     def rule_position_allocation(model, p):   # Allocate each device to a unique position in the rack
-        return model.Allocation[p] == sum(q * model.AllDiff[p, q] for q in model.Position)
+        return LinearExpression(constant=0, linear_coefs=[1] + [-q for q in positions], linear_vars=[model.Allocation[p]] + [model.AllDiff[p, q] for q in positions]) == 0
     model.PositionAllocation = pyo.Constraint(model.Position, rule=rule_position_allocation)
     
     def rule_diff1(model, p):   # All Different constraint, part 1
-        return sum(model.AllDiff[p, q] for q in model.Position) == 1
+        return LinearExpression(constant=0, linear_coefs=[1] * len(positions), linear_vars=[model.AllDiff[p, q] for q in positions]) == 1
     model.Diff1 = pyo.Constraint(model.Position, rule=rule_diff1)
 
     def rule_diff2(model, q):   # All Different constraint, part 2
-        return sum(model.AllDiff[p, q] for p in model.Position) == 1
+        return LinearExpression(constant=0, linear_coefs=[1] * len(positions), linear_vars=[model.AllDiff[p, q] for p in positions]) == 1
     model.Diff2 = pyo.Constraint(model.Position, rule=rule_diff2)
     
+    # Absolute value. As the objective minimizes a positive weighting of the lengths, only the lower side of the absolute value is needed, so no big-M or helper binaries are required
     def rule_lb1(model, p, q):   # Absolute value constraint, part 1
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) >= 0
-        else:
-            return pyo.Constraint.Skip
-    model.LB1 = pyo.Constraint(model.Position, model.Position, rule=rule_lb1)
+        return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) >= 0
+    model.LB1 = pyo.Constraint(model.Connections, rule=rule_lb1)
 
     def rule_lb2(model, p, q):   # Absolute value constraint, part 2
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) >= 0
-        else:
-            return pyo.Constraint.Skip
-    model.LB2 = pyo.Constraint(model.Position, model.Position, rule=rule_lb2)
-    
-    def rule_ub1(model, p, q):   # Absolute value constraint, part 3
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) <= 2 * (model.NumDevices - 1) * model.d2[p, q]
-        else:
-            return pyo.Constraint.Skip
-    model.UB1 = pyo.Constraint(model.Position, model.Position, rule=rule_ub1)
-
-    def rule_ub2(model, p, q):   # Absolute value constraint, part 4
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) <= 2 * (model.NumDevices - 1) * model.d1[p, q]
-        else:
-            return pyo.Constraint.Skip
-    model.UB2 = pyo.Constraint(model.Position, model.Position, rule=rule_ub2)
-
-    def rule_d1d2(model, p, q):   # Absolute value constraint, part 5
-        if p < q:
-            return model.d1[p, q] + model.d2[p, q] == 1
-        else:
-            return pyo.Constraint.Skip
-    model.d1d2 = pyo.Constraint(model.Position, model.Position, rule=rule_d1d2)
-
-    def rule_extra(model):   # Additional constraint, lower bound if all lengths are 1
-        return sum(model.Cables[p, q] * model.AbsLength[p, q] for p in model.Position for q in model.Position) >= model.LengthLB
-    model.Extra = pyo.Constraint(rule=rule_extra)
-
-    for p in model.Position:
-        for q in model.Position:
-            if p >= q:
-                model.AbsLength[p, q].fix(0)
-                model.d1[p, q].fix(0)
-                model.d1[p, q].fix(0)
-
-    def rule_obj(model):   # Min total length of cables
-        return sum(model.Cables[p, q] * model.AbsLength[p, q] for p in model.Position for q in model.Position)
-    model.Obj = pyo.Objective(rule=rule_obj, sense=pyo.minimize)
+        return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) >= 0
+    model.LB2 = pyo.Constraint(model.Connections, rule=rule_lb2)
+
+    total_length = LinearExpression(constant=0, linear_coefs=[model.Cables[c] for c in connections], linear_vars=[model.AbsLength[c] for c in connections])
+
+    model.Extra = pyo.Constraint(expr=total_length >= model.LengthLB)   # Additional constraint, lower bound if all lengths are 1
+
+    model.Obj = pyo.Objective(expr=total_length, sense=pyo.minimize)   # Min total length of cables
 
     return model
 
@@ -161,8 +130,8 @@ def write_output(model, write_solution, condition):   # Write the solution and r
         best_case = [round(pyo.value(model.Allocation[u]), 0) for u in range(len(model.Allocation))]
         for v in range(len(model.Allocation)):
             index = best_case.index(v)
-            curr_name = chr(index + ord("A"))
-            print(f'{v + 1:>8}    {curr_name:>7}')   # Assumes devices are named A, B, C, etc
+            curr_name = index_to_letter(index)
+            print(f'{v + 1:>8}    {curr_name:>7}')
     else:
         exit_message = 'No feasible solution found. Check that the data is valid'
         print(exit_message)
@@ -2,12 +2,18 @@
 
 # Import dependencies
 import pyomo.environ as pyo
+from pyomo.core.expr.numeric_expr import LinearExpression
 import time as tm
 import random as rd
 import multiprocessing as mp
+import math
+import os
+import tempfile
+import highspy
+from cable_data import load_cable_data, index_to_letter
 
 # Data
-from data.data_08 import *   # Data file, in Python format, like data_08.py
+cable_struct = load_cable_data('data_08')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
 cable_struct = [sorted(row[:2]) + [row[2]] for row in cable_struct]   # Sort the devices in ascending order
 
 # File assumptions
@@ -18,6 +24,7 @@ WRITE_MODEL_FILE = False   # Write Pyomo model file
 MODEL_NAME = 'Model 5b: Cable length management, Pyomo MILP parallel'
 TIME_LIMIT = 60   # Seconds
 NUM_THREADS = 16   # Number of threads to use
+BUILD_ONCE = True   # Build the model once and write it to an MPS file that each thread loads directly into HiGHS, sharing the best solution between threads
 
 # Solver options
 SOLVER_NAME = 'appsi_highs'   # Local solver to use
@@ -25,6 +32,7 @@ VERBOSE = False   # Turn off verbose solver output
 LOAD_SOLUTION = False   # Defer loading a solution until we know if there is a solution to load
 PRESOLVE = 'on'   # Perform presolve step, or not
 WRITE_LOG_FILE = True   # Write HiGHS log file
+NO_SOLUTION = 1e30   # Shared best objective before any solution is found
 
 def set_up_solver(model, thread_id):   # Create the local Solver object, assumed to be HiGHS
     solver = pyo.SolverFactory(pyo.value(model.Engine))   # Local solver assumed to be installed
@@ -54,86 +62,53 @@ def get_data():   # Get data from data file
     return num_connections, num_devices, max_diff, length_lb
     
 def define_model_data(model, num_connections, num_devices, max_diff, length_lb):   # Define model data, assigning all data to the Model
+    connection_cables = {}   # Cables between each connected pair of devices. Duplicate connections are combined
+    for device_from, device_to, cables in cable_struct:
+        connection_cables[device_from, device_to] = connection_cables.get((device_from, device_to), 0) + cables
     model.Position = pyo.Set(initialize=range(num_devices))   # Position of device in rack
-    model.Cables = pyo.Param(model.Position, model.Position, within=pyo.NonNegativeIntegers, initialize=0, mutable=True)   # Number of cables between devices
+    model.Connections = pyo.Set(initialize=sorted(connection_cables), dimen=2)   # Connected pairs of devices, with device_from < device_to
+    model.Cables = pyo.Param(model.Connections, within=pyo.NonNegativeIntegers, initialize=connection_cables)   # Number of cables between connected devices
     model.NumConnections = num_connections
     model.NumDevices = num_devices
     model.MaxDiff = max_diff
     model.LengthLB = length_lb
     
-    for device_from, device_to, cables in cable_struct:
-        model.Cables[device_from, device_to] = cables
-    
     return model
 
-def define_model(model):   # Define the model as a Mixed Integer Linear Program
+def define_model(model):   # Define the model as a Mixed Integer Linear Program. Lengths are defined only for connected pairs of devices
     model.Allocation = pyo.Var(model.Position, within=pyo.NonNegativeIntegers, bounds=(0, model.NumDevices - 1), initialize=0)   # Position of device in rack
     model.AllDiff = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Make each rack position unique
-    model.AbsLength = pyo.Var(model.Position, model.Position, within=pyo.NonNegativeIntegers, bounds=(0, model.NumDevices - 1), initialize=0)   # Absolute value of cable length
-    model.d1 = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Helper for calculation of absolute value
-    model.d2 = pyo.Var(model.Position, model.Position, within=pyo.Binary, initialize=0)   # Helper for calculation of absolute value
+    model.AbsLength = pyo.Var(model.Connections, within=pyo.NonNegativeIntegers, bounds=(1, model.NumDevices - 1), initialize=1)   # Absolute value of cable length. Devices are in different positions, so at least 1
     
+    positions = list(model.Position)
+    connections = list(model.Connections)
+
     def rule_position_allocation(model, p):   # Allocate each device to a unique position in the rack
-        return model.Allocation[p] == sum(q * model.AllDiff[p, q] for q in model.Position)
+        return LinearExpression(constant=0, linear_coefs=[1] + [-q for q in positions], linear_vars=[model.Allocation[p]] + [model.AllDiff[p, q] for q in positions]) == 0
     model.PositionAllocation = pyo.Constraint(model.Position, rule=rule_position_allocation)
     
     def rule_diff1(model, p):   # All Different constraint, part 1
-        return sum(model.AllDiff[p, q] for q in model.Position) == 1
+        return LinearExpression(constant=0, linear_coefs=[1] * len(positions), linear_vars=[model.AllDiff[p, q] for q in positions]) == 1
     model.Diff1 = pyo.Constraint(model.Position, rule=rule_diff1)
 
     def rule_diff2(model, q):   # All Different constraint, part 2
-        return sum(model.AllDiff[p, q] for p in model.Position) == 1
+        return LinearExpression(constant=0, linear_coefs=[1] * len(positions), linear_vars=[model.AllDiff[p, q] for p in positions]) == 1
     model.Diff2 = pyo.Constraint(model.Position, rule=rule_diff2)
     
+    # Absolute value. As the objective minimizes a positive weighting of the lengths, only the lower side of the absolute value is needed, so no big-M or helper binaries are required
     def rule_lb1(model, p, q):   # Absolute value constraint, part 1
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) >= 0
-        else:
-            return pyo.Constraint.Skip
-    model.LB1 = pyo.Constraint(model.Position, model.Position, rule=rule_lb1)
+        return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) >= 0
+    model.LB1 = pyo.Constraint(model.Connections, rule=rule_lb1)
 
     def rule_lb2(model, p, q):   # Absolute value constraint, part 2
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) >= 0
-        else:
-            return pyo.Constraint.Skip
-    model.LB2 = pyo.Constraint(model.Position, model.Position, rule=rule_lb2)
-    
-    def rule_ub1(model, p, q):   # Absolute value constraint, part 3
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[p] - model.Allocation[q]) <= 2 * (model.NumDevices - 1) * model.d2[p, q]
-        else:
-            return pyo.Constraint.Skip
-    model.UB1 = pyo.Constraint(model.Position, model.Position, rule=rule_ub1)
+        return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) >= 0
+    model.LB2 = pyo.Constraint(model.Connections, rule=rule_lb2)
 
-    def rule_ub2(model, p, q):   # Absolute value constraint, part 4
-        if p < q:
-            return model.AbsLength[p, q] - (model.Allocation[q] - model.Allocation[p]) <= 2 * (model.NumDevices - 1) * model.d1[p, q]
-        else:
-            return pyo.Constraint.Skip
-    model.UB2 = pyo.Constraint(model.Position, model.Position, rule=rule_ub2)
-
-    def rule_d1d2(model, p, q):   # Absolute value constraint, part 5
-        if p < q:
-            return model.d1[p, q] + model.d2[p, q] == 1
-        else:
-            return pyo.Constraint.Skip
-    model.d1d2 = pyo.Constraint(model.Position, model.Position, rule=rule_d1d2)
-
-    def rule_extra(model):   # Additional constraint, lower bound if all lengths are 1
-        return sum(model.Cables[p, q] * model.AbsLength[p, q] for p in model.Position for q in model.Position) >= model.LengthLB
-    model.Extra = pyo.Constraint(rule=rule_extra)
+    total_length = LinearExpression(constant=0, linear_coefs=[model.Cables[c] for c in connections], linear_vars=[model.AbsLength[c] for c in connections])
 
-    for p in model.Position:
-        for q in model.Position:
-            if p >= q:
-                model.AbsLength[p, q].fix(0)
-                model.d1[p, q].fix(0)
-                model.d1[p, q].fix(0)
+    model.Extra = pyo.Constraint(expr=total_length >= model.LengthLB)   # Additional constraint, lower bound if all lengths are 1
 
-    def rule_obj(model):   # Min total length of cables
-        return sum(model.Cables[p, q] * model.AbsLength[p, q] for p in model.Position for q in model.Position)
-    model.Obj = pyo.Objective(rule=rule_obj, sense=pyo.minimize)
+    model.Obj = pyo.Objective(expr=total_length, sense=pyo.minimize)   # Min total length of cables
 
     return model
 
@@ -166,8 +141,8 @@ def write_thread_solution(model, write_solution, thread_id, condition, elapsed_t
         print(f"Objective: {objective_value:,.0f}")
         print("Position     Device")
         for v, pos in enumerate(best_case):
-            curr_name = chr(best_case.index(v) + ord("A"))
-            print(f'{v + 1:>8}    {curr_name:>7}')   # Assumes devices are named A, B, C, etc
+            curr_name = index_to_letter(best_case.index(v))
+            print(f'{v + 1:>8}    {curr_name:>7}')
         print('-' * 40)
     else:
         print(f"\nThread {thread_id} completed in {elapsed_time:.2f} seconds:")
@@ -196,6 +171,97 @@ def run_model_thread(lock, thread_id):   # Create and run a single thread
         objective_value, best_case = write_thread_solution(model, write_solution, thread_id, condition, elapsed_time)
     return thread_id, condition, objective_value, best_case, elapsed_time
 
+def build_model_file(directory):   # Build the model once, in the main process, and write it to an MPS file. Returns the file name, the column name of each device's position, and the number of columns
+    model = pyo.ConcreteModel(name=MODEL_NAME)
+    num_connections, num_devices, max_diff, length_lb = get_data()
+    model = define_model_data(model, num_connections, num_devices, max_diff, length_lb)
+    model = define_model(model)
+    filename, symbol_map_id = model.write(os.path.join(directory, 'model.mps'), io_options={'symbolic_solver_labels': False})
+    symbol_map = model.solutions.symbol_map[symbol_map_id]
+    allocation_names = [symbol_map.getSymbol(model.Allocation[p]) for p in model.Position]
+    highs = highspy.Highs()   # Read the file back, to get the number of columns as HiGHS sees them
+    highs.setOptionValue('output_flag', False)
+    highs.readModel(filename)
+    return filename, allocation_names, highs.getNumCol()
+
+def init_file_thread(state):   # Shared memory must be passed to each process when it starts, rather than as a task argument
+    global shared_state
+    shared_state = state
+
+def create_shared_state(num_cols):   # Best solution shared by the threads, in shared memory, plus an event to stop all threads
+    return {'lock': mp.Lock(),
+            'stop': mp.Event(),
+            'best_objective': mp.RawValue('d', NO_SOLUTION),
+            'best_solution': mp.RawArray('d', num_cols)}
+
+def update_incumbent(objective_value, solution):   # Atomic compare-and-update of the shared best solution
+    if objective_value >= shared_state['best_objective'].value:   # Cheap check without the lock; the best objective only ever decreases
+        return
+    with shared_state['lock']:
+        if objective_value < shared_state['best_objective'].value:
+            shared_state['best_objective'].value = objective_value
+            shared_state['best_solution'][:] = solution
+
+def highs_callback(callback_type, message, data_out, data_in, user_data):   # Share solutions between threads, and stop when any thread proves optimality
+    if callback_type == highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution:
+        update_incumbent(data_out.objective_function_value, data_out.mip_solution)
+    elif callback_type == highspy.cb.HighsCallbackType.kCallbackMipUserSolution:
+        if shared_state['best_objective'].value < data_out.mip_primal_bound:   # Another thread has a better solution, so give it to this thread
+            with shared_state['lock']:
+                data_in.setSolution(list(shared_state['best_solution']))
+    elif callback_type == highspy.cb.HighsCallbackType.kCallbackMipInterrupt:
+        if shared_state['stop'].is_set():
+            data_in.user_interrupt = True
+        elif math.isfinite(data_out.mip_dual_bound) and math.ceil(data_out.mip_dual_bound - 1e-6) >= shared_state['best_objective'].value:   # Lengths are integer, so the shared best solution is optimal
+            shared_state['stop'].set()
+            data_in.user_interrupt = True
+
+def run_file_thread(filename, allocation_names, thread_id):   # Load the model file into HiGHS and solve with this thread's seed
+    start_time = tm.time()
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', VERBOSE or WRITE_LOG_FILE)
+    highs.setOptionValue('log_to_console', VERBOSE)
+    if WRITE_LOG_FILE:
+        highs.setOptionValue('log_file', f'highslog_{thread_id:02}.txt')
+    highs.setOptionValue('time_limit', float(TIME_LIMIT))
+    highs.setOptionValue('presolve', PRESOLVE)
+    highs.setOptionValue('random_seed', rd.randrange(2**31) - 1)   # Different seed for each thread
+    highs.readModel(filename)
+    highs.setCallback(highs_callback, None)
+    for callback_type in (highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution,
+                          highspy.cb.HighsCallbackType.kCallbackMipUserSolution,
+                          highspy.cb.HighsCallbackType.kCallbackMipInterrupt):
+        highs.startCallback(callback_type)
+    highs.run()
+    status = highs.getModelStatus()
+    condition = highs.modelStatusToString(status)
+    if status == highspy.HighsModelStatus.kOptimal:
+        shared_state['stop'].set()   # Stop the other threads
+    objective_value = None
+    best_case = None
+    if highs.getInfo().primal_solution_status == 2:   # Feasible solution available
+        objective_value = highs.getInfo().objective_function_value
+        values = highs.getSolution().col_value
+        col_index = {name: i for i, name in enumerate(highs.getLp().col_names_)}
+        best_case = [round(values[col_index[name]]) for name in allocation_names]
+    elapsed_time = tm.time() - start_time
+    with shared_state['lock']:   # Acquire lock so that different threads don't print simultaneously
+        write_file_thread_solution(thread_id, condition, objective_value, best_case, elapsed_time)
+    return thread_id, condition, objective_value, best_case, elapsed_time
+
+def write_file_thread_solution(thread_id, condition, objective_value, best_case, elapsed_time):   # Write solution for a thread that loaded the model file
+    print(f"\nThread {thread_id} completed in {elapsed_time:.2f} seconds:")
+    print(f"Status: {condition}")
+    if best_case is not None:
+        print(f"Objective: {objective_value:,.0f}")
+        print("Position     Device")
+        for v in range(len(best_case)):
+            curr_name = index_to_letter(best_case.index(v))
+            print(f'{v + 1:>8}    {curr_name:>7}')
+    else:
+        print("No feasible solution found.")
+    print('-' * 40)
+
 def write_summary(all_results):   # Write summary of all threads
     print("\nSummary of all threads:\n")
     print(f"{'Thread':<10} {'Status':<15} {'Seconds':<10} {'Objective':<20}")
@@ -208,8 +274,21 @@ def write_summary(all_results):   # Write summary of all threads
         print(f"{thread_id:>4}       {condition:<15} {elapsed_time:<10.1f} {objective_str:>9}")
     print('-' * 47)
     
+def main_build_once(threads):   # Build the model once, then solve the model file in each thread, sharing the best solution
+    with tempfile.TemporaryDirectory() as directory:
+        filename, allocation_names, num_cols = build_model_file(directory)
+        state = create_shared_state(num_cols)
+        with mp.Pool(processes=mp.cpu_count(), initializer=init_file_thread, initargs=(state,)) as pool:
+            results = [pool.apply_async(run_file_thread, (filename, allocation_names, i,)) for i in range(threads)]
+            all_results = [result.get() for result in results]
+    all_results.sort(key=lambda x: x[0])  # Sort results by thread_id
+    write_summary(all_results)
+
 def main(threads):   # Run the model
     print(MODEL_NAME, '\n')
+    if BUILD_ONCE:
+        main_build_once(threads)
+        return
     with mp.Manager() as manager:   # Create manager to pass lock to threads; necessary on Windows
         lock = manager.Lock()
         with mp.Pool(processes=mp.cpu_count()) as pool:
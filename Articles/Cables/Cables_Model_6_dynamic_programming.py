@@ -0,0 +1,102 @@
+# Cabling management, Model 6: Exact dynamic programming over subsets of devices
+# The total cable length of an order equals the sum, over each gap between adjacent rack positions, of the cables that cross that gap.
+# The cables crossing the gap after the first k positions depend only on which set of devices occupies those positions, not on their order.
+# So the minimum length of placing a set S of devices in the first |S| positions is: best[S] = cut[S] + min over v in S of best[S - v].
+# Sets are represented as bitmasks, used directly as indices into NumPy arrays. The sets are processed in layers of equal size.
+# This proves optimality for up to about 24 devices. Memory use doubles for each additional device.
+
+import time
+import numpy as np
+
+import cable_search as cs
+from cable_data import load_cable_data, index_to_letter
+
+# Data
+cable_struct = load_cable_data('data_12')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
+
+# Constants
+MODEL_NAME = 'Model 6: Cable length management, dynamic programming'
+MAX_DEVICES = 26   # Largest number of devices allowed, as memory use is about 20 * 2^devices bytes
+INFEASIBLE = np.iinfo(np.int32).max   # Marker for sets that haven't been evaluated yet
+
+def calculate_weights(cable_structure, num_devices):   # Symmetric matrix of cables between each pair of devices
+    weights = np.zeros((num_devices, num_devices), dtype=np.int32)
+    for device_from, device_to, cables in cable_structure:
+        if device_from != device_to:   # A device connected to itself contributes no length
+            weights[device_from, device_to] += cables
+            weights[device_to, device_from] += cables
+    return weights
+
+def calculate_cuts(weights, num_devices):   # Cables between each set of devices and the other devices, for every set
+    degree = weights.sum(axis=1)
+    cut = np.zeros(1, dtype=np.int32)
+    for b in range(num_devices):   # Sets containing device b are the sets without b, plus b
+        internal = np.zeros(1, dtype=np.int32)   # Cables between device b and each set of devices lower than b
+        for u in range(b):
+            internal = np.concatenate((internal, internal + weights[u, b]))
+        cut = np.concatenate((cut, cut + degree[b] - 2 * internal))
+    return cut
+
+def calculate_set_sizes(num_devices):   # Number of devices in each set
+    size = np.zeros(1, dtype=np.int8)
+    for _ in range(num_devices):
+        size = np.concatenate((size, size + 1))
+    return size
+
+def solve(cut, num_devices):   # Minimum length for placing each set of devices in the first positions of the rack
+    best = np.full(2**num_devices, INFEASIBLE, dtype=np.int32)
+    best[0] = 0
+    size = calculate_set_sizes(num_devices)
+    layers = np.argsort(size, kind='stable').astype(np.int32)   # Sets grouped by size
+    layer_starts = np.searchsorted(size[layers], np.arange(num_devices + 2))
+    for k in range(1, num_devices + 1):
+        sets = layers[layer_starts[k]:layer_starts[k + 1]]
+        candidate = np.full(len(sets), INFEASIBLE, dtype=np.int32)
+        for v in range(num_devices):   # Remove v from each set. If v isn't in a set, then the lookup is of a larger set that is still INFEASIBLE
+            np.minimum(candidate, best[sets ^ (1 << v)], out=candidate)
+        best[sets] = candidate + cut[sets]
+    return best
+
+def extract_order(best, cut, num_devices):   # Work back from the full set to recover the position of each device
+    order = [0] * num_devices   # order[device] = position, as in the other models
+    current = 2**num_devices - 1
+    for position in range(num_devices - 1, -1, -1):
+        for v in range(num_devices):
+            if (current >> v) & 1 and best[current ^ (1 << v)] == best[current] - cut[current]:
+                order[v] = position
+                current ^= 1 << v
+                break
+    return order
+
+def print_solution(min_length, order, cable_structure, run_time):   # Print solution in the same format as the other models
+    print(f'{MODEL_NAME}\n')
+    print('Solution')
+    print('======================================\n')
+    print(f'Status:    OPTIMAL')
+    print(f'Objective: {min_length:<7,.0f}')
+    print(f'Run time:  {run_time:,.2f} seconds\n')
+    print('Position     Device')
+    for v in range(len(order)):
+        curr_name = index_to_letter(order.index(v))
+        print(f'{v + 1:>8}    {curr_name:>7}')
+    print('\nConnection    Length')
+    for c, (device_from, device_to, cables) in enumerate(cable_structure):
+        print(f'{c + 1:>10}    {abs(order[device_from] - order[device_to]) * cables:>6}')
+    print('--------------------')
+    print(f'Total {min_length:>14.0f}')
+
+def main():
+    start_time = time.time()
+    num_devices = cs.calculate_num_devices(cable_struct)
+    if num_devices > MAX_DEVICES:
+        print(f'{MODEL_NAME}\n\nToo many devices: {num_devices}. Maximum is {MAX_DEVICES}')
+        return
+    weights = calculate_weights(cable_struct, num_devices)
+    cut = calculate_cuts(weights, num_devices)
+    best = solve(cut, num_devices)
+    min_length = int(best[-1])
+    order = extract_order(best, cut, num_devices)
+    print_solution(min_length, order, cable_struct, time.time() - start_time)
+
+if __name__ == "__main__":
+    main()
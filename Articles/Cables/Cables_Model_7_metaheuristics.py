@@ -0,0 +1,121 @@
+# Cabling management, Model 7: Metaheuristic search
+# Like Model 3, each cpu core/thread searches from a random order, with restarts at a specified interval. The search continues for the specified time.
+# Rather than only accepting improving swaps, each process uses either simulated annealing or tabu search, over swap, insert, and block reversal moves.
+# The search engine is in cable_search.py, so it can be used by other models too.
+# Each process reports its progress as events to a collector in the main process, which prints updates and writes the events to a JSON lines file.
+
+import os
+import time
+import random
+import multiprocessing as mp
+
+import cable_search as cs
+import cable_telemetry as ct
+from cable_data import load_cable_data
+
+# Data
+cable_struct = load_cable_data('data_20')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
+
+# Constants
+MAX_TIME = 60   # Maximum overall run time, seconds
+MAX_TIME_BUFFER = 1   # Small buffer to allow final iteration of results to print, seconds
+UPDATE_INTERVAL = 5   # Time interval for printing current best solution, seconds
+OUTPUT_FOLDER = os.path.dirname(os.path.abspath(__file__))   # Folder for the telemetry file. By default next to this script, whatever the current folder is
+TELEMETRY_FILENAME = os.path.join(OUTPUT_FOLDER, 'Model7_telemetry.jsonl')   # File for progress events from each process
+RESTART_INTERVAL = 10   # Time interval for restarting each process, seconds
+RESTART_PROBABILITY = 0.5  # Probability of a thread restarting with a random order at each restart interval
+METHOD = 'annealing'   # 'annealing' or 'tabu'
+MOVES = ('swap', 'insert', 'reverse')   # Neighbourhoods to use
+START_ACCEPTANCE = 0.5   # Annealing: probability of accepting an average worsening move at the start of each restart cycle
+END_ACCEPTANCE = 0.001   # Annealing: probability of accepting an average worsening move at the end of each restart cycle
+TABU_TENURE = 10   # Tabu: number of iterations before a device may return to a position it left
+TABU_SAMPLE = 50   # Tabu: number of moves evaluated at each iteration
+
+def print_progress(elapsed_time, min_length, pct_done, new_best):   # Print current solution, marking with asterisk if best found so far
+    print(f'{elapsed_time:>9,.0f}  {pct_done:>7,.2%}   {min_length:>4,.0f}', f'*' if new_best else f'')
+
+def print_header():    # Header for progress updates
+    print(f'Model 7: Cable length management, {METHOD} in parallel\n')
+    print('     Time    %done     Best')
+    print('---------------------------')
+
+def metaheuristic_chunk(cable_struct, num_devices, start_time, max_time):   # Each processor's chunk of the search
+    search = cs.LayoutSearch(cable_struct, num_devices, MOVES, RESTART_INTERVAL)
+    order = list(range(num_devices))
+    random.shuffle(order)
+    search.reset(order)
+    start_temp = search.initial_temperature(START_ACCEPTANCE)
+    end_temp = search.initial_temperature(END_ACCEPTANCE)
+    min_length = search.best_length   # Best length found by this process
+    if cs.update_incumbent(min_length, search.best_order):   # Publish the starting order, so a restart from the shared best solution never reads the empty placeholder
+        ct.report_incumbent(min_length)
+    end_time = start_time + max_time + MAX_TIME_BUFFER
+    last_update = time.time()
+    last_restart = time.time()
+    local_count = 0   # Moves evaluated and restarts since the last progress event
+    restarts = 0
+    accepted = 0   # Moves made by the search, at the last progress event
+
+    while time.time() < end_time:
+        until = min(last_update + ct.TELEMETRY_INTERVAL, last_restart + RESTART_INTERVAL, end_time)   # Search until the next co-ordination event
+        if METHOD == 'annealing':
+            local_count += search.anneal(until, start_temp, end_temp)
+        else:
+            local_count += search.tabu(until, TABU_TENURE, TABU_SAMPLE)
+        if search.best_length < min_length:
+            min_length = search.best_length
+            if cs.update_incumbent(min_length, search.best_order):   # Update best solution found so far
+                ct.report_incumbent(min_length)
+
+        current_time = time.time()
+        if current_time - last_update >= ct.TELEMETRY_INTERVAL:   # At some interval, report progress to the collector, which prints updates
+            ct.report_progress(local_count, search.accepted - accepted, restarts)
+            accepted = search.accepted
+            local_count = restarts = 0
+            last_update += ct.TELEMETRY_INTERVAL   # Defer reporting until next regular time
+
+        if current_time - last_restart >= RESTART_INTERVAL:   # Potentially restart with a new random order every RESTART_INTERVAL seconds
+            if random.random() <= RESTART_PROBABILITY:
+                random.shuffle(order)
+            else:
+                _, order = cs.read_incumbent()   # Continue from the best solution found by any process
+            search.reset(order)
+            restarts += 1
+            last_restart = current_time
+
+    ct.report_progress(local_count, search.accepted - accepted, restarts)   # Include moves since the last progress event
+    return search.best_length, search.best_order
+
+def run_pool(num_devices, num_processes, cable_struct, start_time):   # Establish and run the processor pool
+    state = cs.create_shared_state(num_devices)
+    events = ct.create_queue()
+    collector = ct.Collector(events, start_time, UPDATE_INTERVAL, lambda elapsed_time, count: elapsed_time / MAX_TIME, print_progress, TELEMETRY_FILENAME).start()
+    with mp.Pool(processes = num_processes, initializer = cs.init_worker, initargs = (state, events)) as pool:
+        results = [pool.apply_async(metaheuristic_chunk, (cable_struct, num_devices, start_time, MAX_TIME))
+                                    for _ in range(num_processes)]
+        results = [res.get() for res in results]   # Collate results from each process
+        pool.close()
+        pool.join()   # Let the processes exit normally, so their last events reach the collector
+    collector.stop()
+    return results, collector.total_count
+
+def print_results(results, num_devices, total_count, start_time):   # Print final results after processor pool completes
+    min_length = min(res[0] for res in results)
+    best_case = next(res[1] for res in results if res[0] == min_length)
+    run_time = time.time() - start_time
+    print(f'\nDevices: {num_devices}')
+    print(f'Minimum length: {min_length}')
+    print(f'Best case: {[cs.index_to_letter(best_case.index(v)) for v in range(len(best_case))]}')   # 0 is at index 4 of [5, 4, 7, 1, 0, 3, 2, 6], so index 0 of result is 'A' + 4 -> 'E', etc
+    print(f'Rate: {total_count/run_time:,.0f} moves per second')
+    print(f'Time: {run_time:,.2f} seconds')
+
+def main():
+    start_time = time.time()
+    num_devices = cs.calculate_num_devices(cable_struct)
+    num_processes = mp.cpu_count()
+    print_header()
+    results, total_count = run_pool(num_devices, num_processes, cable_struct, start_time)
+    print_results(results, num_devices, total_count, start_time)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# Cabling management, Model 8: Portfolio of methods run at the same time
+# Local search (tabu search from cable_search.py), constraint programming (OR-Tools CP-SAT), and MILP (HiGHS) each run on a share of the cpu cores/threads.
+# The methods share the best order found and the best lower bound, in shared memory:
+# - Local search restarts from the best order found by any method.
+# - CP-SAT runs in rounds. Each round starts from the best order as a hint, and requires a better length, so an infeasible round proves the best order is optimal.
+# - HiGHS is given the best order as a solution during its search, which it also uses as a cutoff.
+# All methods stop when the lower bound meets the best length, or at the time limit.
+# OR-Tools and highspy can't be imported into the same process, so each is imported only in the process that uses it.
+
+import time
+import random
+import threading
+import multiprocessing as mp
+
+import cable_search as cs
+from cable_data import load_cable_data
+
+# Data
+cable_struct = load_cable_data('data_16')   # Data file in the data folder, in Python format, like data_08.py, or NumPy format, like data_1000.npz
+
+# Constants
+MAX_TIME = 60   # Maximum overall run time, seconds
+UPDATE_INTERVAL = 5   # Time interval for printing current best solution, seconds
+RESTART_INTERVAL = 5   # Local search: time interval for restarting each process, seconds
+RESTART_PROBABILITY = 0.2   # Local search: probability of restarting with a random order, rather than the best order
+TABU_TENURE = 10   # Local search: number of iterations before a device may return to a position it left
+TABU_SAMPLE = 50   # Local search: number of moves evaluated at each iteration
+CPSAT_SHARE = 0.5   # Share of cpu cores/threads for CP-SAT workers. HiGHS uses one, and local search uses the rest (at least one)
+HIGHS_MAX_DEVICES = 100   # HiGHS: largest number of devices to use it for, as its model has devices^2 assignment variables
+CPSAT_ROUND_TIME = 5   # CP-SAT: time for each round, before restarting with the best order as a hint, seconds
+STOP_POLL_INTERVAL = 0.1   # Time interval for checking whether to stop, seconds
+ENGINES = ['Local search', 'CP-SAT', 'HiGHS']   # Source of each new best solution
+
+def connection_weights(cable_structure):   # Cables between each connected pair of devices, as a dictionary of (lower device, higher device): cables
+    weights = {}
+    for device_from, device_to, cables in cable_structure:
+        if device_from != device_to:   # A device connected to itself contributes no length
+            pair = (min(device_from, device_to), max(device_from, device_to))
+            weights[pair] = weights.get(pair, 0) + cables
+    return weights
+
+def degree_lower_bound(cable_structure, num_devices):   # At best, each device's two most connected neighbours are at distance 1, the next two at distance 2, etc. Each cable is attached to two devices
+    neighbour_cables = [dict() for _ in range(num_devices)]
+    for (device_from, device_to), cables in connection_weights(cable_structure).items():
+        neighbour_cables[device_from][device_to] = cables
+        neighbour_cables[device_to][device_from] = cables
+    total = 0
+    for d in range(num_devices):
+        weights = sorted(neighbour_cables[d].values(), reverse=True)
+        total += sum(cables * (i // 2 + 1) for i, cables in enumerate(weights))
+    return (total + 1) // 2
+
+def create_portfolio_state(num_devices):   # Shared state of cable_search, plus the lower bound, a stop flag, and the source of the best solution
+    state = cs.create_shared_state(num_devices)
+    state['lower_bound'] = mp.RawValue('q', 0)
+    state['stop'] = mp.RawValue('b', False)   # A flag, polled by each method, rather than an Event, so checking it never waits for a lock
+    state['source'] = mp.RawValue('i', -1)
+    return state
+
+def publish_solution(engine, length, order):   # Share a solution with the other methods
+    if cs.update_incumbent(length, order):
+        cs.shared_state['source'].value = engine
+
+def publish_bound(bound):   # Share a lower bound with the other methods. Stop everything if it meets the best length
+    with cs.shared_state['lock']:
+        if bound > cs.shared_state['lower_bound'].value:
+            cs.shared_state['lower_bound'].value = bound
+    if cs.shared_state['lower_bound'].value >= cs.shared_state['min_length'].value:
+        cs.shared_state['stop'].value = True
+
+def run_local_search(state, cable_struct, num_devices, end_time):   # Tabu search, restarting from the best order found by any method
+    cs.init_worker(state)
+    search = cs.LayoutSearch(cable_struct, num_devices, ('swap', 'insert', 'reverse'), RESTART_INTERVAL)
+    order = list(range(num_devices))
+    random.shuffle(order)
+    search.reset(order)
+    while time.time() < end_time and not state['stop'].value:
+        restart_time = min(time.time() + RESTART_INTERVAL, end_time)
+        while time.time() < restart_time and not state['stop'].value:   # Search in short steps, so the process stops promptly
+            search.tabu(min(time.time() + STOP_POLL_INTERVAL, restart_time), TABU_TENURE, TABU_SAMPLE)
+            publish_solution(0, search.best_length, search.best_order)
+        if random.random() <= RESTART_PROBABILITY:
+            random.shuffle(order)
+        else:
+            _, order = cs.read_incumbent()
+        search.reset(order)
+
+def run_cpsat(state, cable_struct, num_devices, end_time, workers):   # CP-SAT in rounds, each starting from the best order found by any method
+    from ortools.sat.python import cp_model
+    cs.init_worker(state)
+    weights = connection_weights(cable_struct)
+    current = {'solver': None}
+
+    def stop_on_flag():   # Stop the current round when another method proves optimality
+        while not state['stop'].value:
+            time.sleep(STOP_POLL_INTERVAL)
+        if current['solver'] is not None:
+            current['solver'].StopSearch()
+    threading.Thread(target=stop_on_flag, daemon=True).start()
+
+    class SolutionPublisher(cp_model.CpSolverSolutionCallback):   # Share each solution, and the bound, as it is found
+        def __init__(self, position):
+            cp_model.CpSolverSolutionCallback.__init__(self)
+            self.__position = position
+
+        def on_solution_callback(self):
+            publish_solution(1, round(self.ObjectiveValue()), [self.Value(p) for p in self.__position])
+            publish_bound(round(self.BestObjectiveBound()))
+
+    while time.time() < end_time and not state['stop'].value:
+        best_length, hint = cs.read_incumbent()
+        model = cp_model.CpModel()
+        position = [model.NewIntVar(0, num_devices - 1, f'Position_{d}') for d in range(num_devices)]
+        model.AddAllDifferent(position)
+        lengths = []
+        for (device_from, device_to), cables in weights.items():
+            length = model.NewIntVar(1, num_devices - 1, f'Length_{device_from}_{device_to}')
+            model.AddAbsEquality(length, position[device_from] - position[device_to])
+            lengths.append(cables * length)
+        if num_devices > 1:
+            model.Add(position[0] < position[num_devices - 1])   # Exclude mirror images of each layout
+        model.Minimize(sum(lengths))
+        if best_length < cs.NO_SOLUTION:
+            model.Add(sum(lengths) <= best_length - 1)   # Cutoff: only better solutions are of interest
+            if hint[0] > hint[num_devices - 1]:   # Use the mirror image, so the hint satisfies the symmetry breaking constraint
+                hint = [num_devices - 1 - p for p in hint]
+            for d in range(num_devices):
+                model.AddHint(position[d], hint[d])
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = max(0.1, min(CPSAT_ROUND_TIME, end_time - time.time()))
+        solver.parameters.num_workers = workers
+        current['solver'] = solver
+        status = solver.Solve(model, SolutionPublisher(position))
+        if status == cp_model.INFEASIBLE and best_length < cs.NO_SOLUTION:   # No better solution exists, so the best order is optimal
+            publish_bound(best_length)
+        elif status == cp_model.OPTIMAL:
+            publish_bound(round(solver.ObjectiveValue()))
+        elif status == cp_model.FEASIBLE:
+            publish_bound(round(solver.BestObjectiveBound()))
+
+def run_highs(state, cable_struct, num_devices, end_time):   # MILP with HiGHS, given the best order found by any method during its search
+    import math
+    import numpy as np
+    import highspy
+    cs.init_worker(state)
+    weights = connection_weights(cable_struct)
+    pairs = list(weights)
+    n = num_devices
+    num_cols = n + n * n + len(pairs)   # Columns: position of each device, assignment of device to position, length of each connection
+    x = lambda d, q: n + d * n + q
+    length_col = lambda c: n + n * n + c
+
+    def order_to_solution(order):   # Full column values for an order, so it can be given to HiGHS
+        values = np.zeros(num_cols)
+        for d in range(n):
+            values[d] = order[d]
+            values[x(d, order[d])] = 1
+        for c, (a, b) in enumerate(pairs):
+            values[length_col(c)] = abs(order[a] - order[b])
+        return values
+
+    highs = highspy.Highs()
+    highs.setOptionValue('output_flag', False)
+    highs.setOptionValue('time_limit', max(0.1, end_time - time.time()))
+    costs = np.array([0] * (n + n * n) + [weights[p] for p in pairs], dtype=np.float64)
+    lower = np.array([0] * (n + n * n) + [1] * len(pairs), dtype=np.float64)
+    upper = np.array([n - 1] * n + [1] * (n * n) + [n - 1] * len(pairs), dtype=np.float64)
+    highs.addCols(num_cols, costs, lower, upper, 0, np.zeros(num_cols, dtype=np.int32), np.array([], dtype=np.int32), np.array([], dtype=np.float64))
+    highs.changeColsIntegrality(num_cols, np.arange(num_cols, dtype=np.int32), np.ones(num_cols, dtype=np.uint8))
+    rows = []   # (lower, upper, {column: coefficient})
+    for d in range(n):
+        rows.append((0, 0, {d: 1, **{x(d, q): -q for q in range(n) if q > 0}}))   # Position of each device
+        rows.append((1, 1, {x(d, q): 1 for q in range(n)}))   # Each device in one position
+        rows.append((1, 1, {x(p, d): 1 for p in range(n)}))   # Each position has one device
+    for c, (a, b) in enumerate(pairs):   # Absolute value. The objective minimizes the lengths, so only the lower side is needed
+        rows.append((0, highspy.kHighsInf, {length_col(c): 1, a: -1, b: 1}))
+        rows.append((0, highspy.kHighsInf, {length_col(c): 1, a: 1, b: -1}))
+    if n > 1:
+        rows.append((-highspy.kHighsInf, -1, {0: 1, n - 1: -1}))   # Exclude mirror images of each layout
+    starts = np.cumsum([0] + [len(row[2]) for row in rows[:-1]]).astype(np.int32)
+    indices = np.array([col for row in rows for col in row[2]], dtype=np.int32)
+    values = np.array([coef for row in rows for coef in row[2].values()], dtype=np.float64)
+    highs.addRows(len(rows), np.array([row[0] for row in rows], dtype=np.float64), np.array([row[1] for row in rows], dtype=np.float64), len(indices), starts, indices, values)
+
+    best_length, _ = cs.read_incumbent()
+    if best_length < cs.NO_SOLUTION:
+        highs.setOptionValue('objective_bound', float(best_length))   # Cutoff from solutions already found
+
+    def highs_callback(callback_type, message, data_out, data_in, user_data):   # Share solutions and bounds with the other methods
+        if callback_type == highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution:
+            solution = data_out.mip_solution
+            publish_solution(2, round(data_out.objective_function_value), [round(solution[d]) for d in range(n)])
+        elif callback_type == highspy.cb.HighsCallbackType.kCallbackMipUserSolution:
+            if state['min_length'].value < data_out.mip_primal_bound:   # Another method has a better solution
+                _, order = cs.read_incumbent()
+                if order[0] > order[n - 1]:   # Use the mirror image, so the solution satisfies the symmetry breaking constraint
+                    order = [n - 1 - p for p in order]
+                data_in.setSolution(order_to_solution(order))
+        elif callback_type == highspy.cb.HighsCallbackType.kCallbackMipInterrupt:
+            if math.isfinite(data_out.mip_dual_bound):
+                publish_bound(math.ceil(data_out.mip_dual_bound - 1e-6))   # Lengths are integer
+            if state['stop'].value:
+                data_in.user_interrupt = True
+
+    highs.setCallback(highs_callback, None)
+    for callback_type in (highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution,
+                          highspy.cb.HighsCallbackType.kCallbackMipUserSolution,
+                          highspy.cb.HighsCallbackType.kCallbackMipInterrupt):
+        highs.startCallback(callback_type)
+    highs.run()
+    if highs.getModelStatus() == highspy.HighsModelStatus.kOptimal:
+        publish_bound(round(highs.getInfo().objective_function_value))
+
+def print_header():    # Header for progress updates
+    print('Model 8: Cable length management, portfolio of methods\n')
+    print('     Time     Best    Bound   Found by')
+    print('--------------------------------------')
+
+def print_progress(state, elapsed_time):   # Print current best solution and bound
+    min_length = state['min_length'].value
+    best = f'{min_length:>8,.0f}' if min_length < cs.NO_SOLUTION else f'{"-":>8}'
+    source = ENGINES[state['source'].value] if state['source'].value >= 0 else ''
+    print(f'{elapsed_time:>9,.1f} {best} {state["lower_bound"].value:>8,.0f}   {source}')
+
+def run_portfolio(num_devices, num_processes, cable_struct, start_time):   # Start each method in its own processes, and wait until they finish or are stopped
+    state = create_portfolio_state(num_devices)
+    state['lower_bound'].value = degree_lower_bound(cable_struct, num_devices)
+    end_time = start_time + MAX_TIME
+    cpsat_workers = max(1, int(num_processes * CPSAT_SHARE))
+    local_processes = max(1, num_processes - cpsat_workers - 1)
+    processes = [mp.Process(target=run_local_search, args=(state, cable_struct, num_devices, end_time)) for _ in range(local_processes)]
+    processes.append(mp.Process(target=run_cpsat, args=(state, cable_struct, num_devices, end_time, cpsat_workers)))
+    if num_devices <= HIGHS_MAX_DEVICES:
+        processes.append(mp.Process(target=run_highs, args=(state, cable_struct, num_devices, end_time)))
+    for process in processes:
+        process.start()
+    last_update = time.time()
+    while time.time() < end_time and not state['stop'].value and any(process.is_alive() for process in processes):
+        time.sleep(STOP_POLL_INTERVAL)
+        if state['lower_bound'].value >= state['min_length'].value:
+            state['stop'].value = True
+        if time.time() - last_update >= UPDATE_INTERVAL:
+            print_progress(state, time.time() - start_time)
+            last_update += UPDATE_INTERVAL
+    state['stop'].value = True   # Stop the methods that are still running
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    print_progress(state, time.time() - start_time)
+    return state['min_length'].value, list(state['best_case']), state['lower_bound'].value, state['source'].value
+
+def print_results(min_length, best_case, lower_bound, source, num_devices, start_time):   # Print final results after all methods finish
+    run_time = time.time() - start_time
+    print(f'\nDevices: {num_devices}')
+    print(f'Minimum length: {min_length}' + (' (optimal)' if lower_bound >= min_length else f' (lower bound {lower_bound})'))
+    print(f'Found by: {ENGINES[source] if source >= 0 else "-"}')
+    print(f'Best case: {[cs.index_to_letter(best_case.index(v)) for v in range(len(best_case))]}')   # 0 is at index 4 of [5, 4, 7, 1, 0, 3, 2, 6], so index 0 of result is 'A' + 4 -> 'E', etc
+    print(f'Time: {run_time:,.2f} seconds')
+
+def main():
+    start_time = time.time()
+    num_devices = cs.calculate_num_devices(cable_struct)
+    num_processes = mp.cpu_count()
+    print_header()
+    min_length, best_case, lower_bound, source = run_portfolio(num_devices, num_processes, cable_struct, start_time)
+    print_results(min_length, best_case, lower_bound, source, num_devices, start_time)
+
+if __name__ == "__main__":
+    main()
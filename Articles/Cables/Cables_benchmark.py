@@ -0,0 +1,324 @@
+# Cabling management: Benchmark of the models
+# Each engine is run on each data file, with a fixed seed and time limit, in a fresh process so that memory use is measured separately for each run.
+# For each run we record:
+# - Time to first solution and time to best solution, from the engine's shared best solution (polled), or its progress or solution callbacks.
+#   Model 7 shares its best solution only at each telemetry interval, so its times are rounded up to that interval.
+# - Gap between the best length found and the optimal length, which is found first by dynamic programming (Model 6).
+# - Throughput, as evaluations per second. The unit differs by engine: orders, moves, nodes, branches, or sets.
+# - Peak memory of the largest process in the run, in MB. This uses the resource module, so it isn't available on Windows.
+# Results are written to a CSV file as each run finishes, then summarized in a table that is printed and written to a text file.
+# Most engines run in parallel, so their results also depend on process timing. The seed fixes each process's random starting point, but a run may still differ slightly when repeated.
+# Seeds for pool workers need the fork start method (the default on Linux), as other start methods re-import the engine without the seeded initializer.
+
+import os
+import sys
+import csv
+import time
+import math
+import random
+import functools
+import threading
+import multiprocessing as mp
+import numpy as np
+
+import cable_search as cs
+from cable_data import load_cable_data
+
+try:
+    import resource
+except ImportError:   # Not available on Windows
+    resource = None
+
+# Constants
+DATA_FILES = [f'data_{n:02d}' for n in range(8, 25)]   # Data files in the data folder, in Python or NumPy format
+ENGINES = ['enumeration', 'random', 'local', 'cpsat', 'highs', 'dp', 'annealing', 'tabu', 'portfolio']   # Engines to run, from ENGINE_NAMES
+SEEDS = [1]   # One run of each engine on each data file for each seed
+TIME_LIMIT = 30   # Time limit for each run, seconds
+GRACE_TIME = 30   # Extra time allowed for a run to stop, before it is terminated, seconds
+WATCH_INTERVAL = 0.05   # Time interval for polling the shared best solution, seconds
+OUTPUT_FOLDER = os.path.dirname(os.path.abspath(__file__))   # Folder for the results and summary files. By default next to this script, whatever the current folder is
+RESULTS_FILENAME = os.path.join(OUTPUT_FOLDER, 'benchmark_results.csv')
+SUMMARY_FILENAME = os.path.join(OUTPUT_FOLDER, 'benchmark_summary.txt')
+ENGINE_NAMES = {'enumeration': 'Model 1b enumeration',
+                'random': 'Model 2 random search',
+                'local': 'Model 3 local search',
+                'cpsat': 'Model 4 CP-SAT',
+                'highs': 'Model 5 MILP, HiGHS',   # Sparse Model 5 formulation, as run by Model 8, so that solutions are reported by callback
+                'dp': 'Model 6 dynamic programming',
+                'annealing': 'Model 7 annealing',
+                'tabu': 'Model 7 tabu',
+                'portfolio': 'Model 8 portfolio'}
+FIELDS = ['data', 'devices', 'engine', 'seed', 'time_limit', 'status', 'best_length', 'optimum', 'gap', 'proven',
+          'time_to_first', 'time_to_best', 'run_time', 'evaluations', 'throughput', 'unit', 'peak_memory_mb']
+
+class Trajectory:   # Times at which an engine improves its best length, from the start of a run
+    def __init__(self):
+        self.start_time = time.time()
+        self.points = []   # (elapsed time, length)
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def record(self, length):   # Note a solution, if it is the best so far
+        if length < cs.NO_SOLUTION and (not self.points or length < self.points[-1][1]):
+            self.points.append((self.elapsed(), int(length)))
+
+    def watch(self, state):   # Poll the shared best solution of a pool of processes, in a background thread
+        def poll():
+            while True:
+                self.record(state['min_length'].value)
+                time.sleep(WATCH_INTERVAL)
+        threading.Thread(target=poll, daemon=True).start()
+
+def watch_state(create_state, trajectory):   # Wrap an engine's create_shared_state, so the run's trajectory is taken from the shared best solution
+    def create_and_watch(*args):
+        state = create_state(*args)
+        trajectory.watch(state)
+        return state
+    return create_and_watch
+
+def seed_pool(module, seed):   # Seed each worker of an engine's pool, by wrapping its pool initializer
+    if mp.get_start_method() == 'fork':   # Other start methods pickle the initializer by name, so it can't be replaced
+        module.init_worker = functools.partial(seed_worker, module.init_worker, seed)
+
+def seed_worker(init_worker, seed, *args):   # Pool initializer: the engine's own initializer, then a fixed seed that differs for each worker
+    init_worker(*args)
+    identity = mp.current_process()._identity   # (1,), (2,), ... for pool workers
+    worker_seed = seed * 1000 + (identity[0] if identity else 0)
+    random.seed(worker_seed)
+    np.random.seed(worker_seed)
+
+# Engines. Each runs one model on the data, within the time limit, and returns a dictionary of evaluations, unit, and whether optimality is proven
+def run_enumeration(cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_1b_Enumeration_multi as model
+    model.MAX_TIME = time_limit
+    model.print_progress = lambda elapsed_time, min_length, pct_done: trajectory.record(min_length)   # Called for each new best solution
+    adjacency = cs.build_adjacency(cable_struct, num_devices)
+    prefixes = model.generate_prefixes(num_devices, model.PREFIX_LENGTH)
+    _, _, nodes = model.run_pool(prefixes, adjacency, num_devices, mp.cpu_count(), trajectory.start_time)
+    return {'evaluations': nodes, 'unit': 'nodes', 'proven': trajectory.elapsed() < time_limit}
+
+def run_random(cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_2_random_search_multi as model
+    model.TELEMETRY_FILENAME = os.devnull
+    model.MAX_TIME = time_limit
+    model.CHECKPOINT_INTERVAL = None
+    cs.create_shared_state = watch_state(cs.create_shared_state, trajectory)
+    seed_pool(cs, seed)
+    num_cases = min(math.factorial(num_devices), model.MAX_CASES)
+    num_processes = mp.cpu_count()
+    results = model.run_pool(num_devices, num_processes, num_cases // num_processes, num_cases, cable_struct, trajectory.start_time)
+    return {'evaluations': sum(res[2] for res in results), 'unit': 'orders', 'proven': False}
+
+def run_local(cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_3_local_search as model
+    model.TELEMETRY_FILENAME = os.devnull
+    model.MAX_TIME = time_limit
+    model.CHECKPOINT_INTERVAL = None
+    cs.create_shared_state = watch_state(cs.create_shared_state, trajectory)
+    seed_pool(cs, seed)
+    _, total_count = model.run_pool(num_devices, mp.cpu_count(), cable_struct, trajectory.start_time)
+    return {'evaluations': total_count, 'unit': 'moves', 'proven': False}
+
+def run_cpsat(cable_struct, num_devices, time_limit, seed, trajectory):   # Phase 1 of Model 4, including its local search hint
+    import Cables_Model_4_ortools as model
+    from ortools.sat.python import cp_model
+
+    class TrajectoryCallback(cp_model.CpSolverSolutionCallback):
+        def on_solution_callback(self):
+            trajectory.record(round(self.ObjectiveValue()))
+
+    model.cable_struct = cable_struct   # get_data reads the model's own data
+    num_connections, num_devices, max_diff = model.get_data()
+    hint = model.local_search_hint(cable_struct, num_devices) if model.USE_HINT else None
+    if hint is not None:
+        trajectory.record(cs.calculate_total_length(hint, cable_struct))
+    cp, _, _, _, _ = model.formulation(cable_struct, num_connections, num_devices, max_diff, True, 0, hint)
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = max(0.1, time_limit - trajectory.elapsed())
+    solver.parameters.num_workers = mp.cpu_count()
+    solver.parameters.random_seed = seed
+    status = solver.Solve(cp, TrajectoryCallback())
+    return {'evaluations': solver.NumBranches(), 'unit': 'branches', 'proven': status == cp_model.OPTIMAL}
+
+def run_highs(cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_8_portfolio as model
+    if num_devices > model.HIGHS_MAX_DEVICES:
+        raise ValueError(f'more than {model.HIGHS_MAX_DEVICES} devices')
+    state = model.create_portfolio_state(num_devices)
+    trajectory.watch(state)
+    model.run_highs(state, cable_struct, num_devices, trajectory.start_time + time_limit)
+    return {'evaluations': None, 'unit': '', 'proven': state['lower_bound'].value >= state['min_length'].value}
+
+def run_dp(cable_struct, num_devices, time_limit, seed, trajectory):   # Can't be stopped part way, so the time limit doesn't apply
+    import Cables_Model_6_dynamic_programming as model
+    if num_devices > model.MAX_DEVICES:
+        raise ValueError(f'more than {model.MAX_DEVICES} devices')
+    weights = model.calculate_weights(cable_struct, num_devices)
+    best = model.solve(model.calculate_cuts(weights, num_devices), num_devices)
+    trajectory.record(int(best[-1]))
+    return {'evaluations': 2**num_devices, 'unit': 'sets', 'proven': True}
+
+def run_metaheuristic(method, cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_7_metaheuristics as model
+    model.TELEMETRY_FILENAME = os.devnull
+    model.METHOD = method
+    model.MAX_TIME = time_limit
+    cs.create_shared_state = watch_state(cs.create_shared_state, trajectory)
+    seed_pool(cs, seed)
+    _, total_count = model.run_pool(num_devices, mp.cpu_count(), cable_struct, trajectory.start_time)
+    return {'evaluations': total_count, 'unit': 'moves', 'proven': False}
+
+def run_annealing(cable_struct, num_devices, time_limit, seed, trajectory):
+    return run_metaheuristic('annealing', cable_struct, num_devices, time_limit, seed, trajectory)
+
+def run_tabu(cable_struct, num_devices, time_limit, seed, trajectory):
+    return run_metaheuristic('tabu', cable_struct, num_devices, time_limit, seed, trajectory)
+
+def run_portfolio(cable_struct, num_devices, time_limit, seed, trajectory):
+    import Cables_Model_8_portfolio as model
+    model.MAX_TIME = time_limit
+    model.create_portfolio_state = watch_state(model.create_portfolio_state, trajectory)
+    min_length, _, lower_bound, _ = model.run_portfolio(num_devices, mp.cpu_count(), cable_struct, trajectory.start_time)
+    return {'evaluations': None, 'unit': '', 'proven': lower_bound >= min_length}
+
+ENGINE_RUNNERS = {'enumeration': run_enumeration, 'random': run_random, 'local': run_local, 'cpsat': run_cpsat, 'highs': run_highs,
+                  'dp': run_dp, 'annealing': run_annealing, 'tabu': run_tabu, 'portfolio': run_portfolio}
+
+def peak_memory_mb():   # Peak resident memory of this process or its largest child process
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024 if sys.platform != 'darwin' else peak / 1024**2   # kB on Linux, bytes on macOS
+
+def run_case(engine, data_file, time_limit, seed, start_method, results):   # Run one engine on one data file, in its own process
+    mp.set_start_method(start_method, force=True)   # The engine's own processes start as they would outside the benchmark
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)   # The engines print their own progress, including from solver libraries
+    sys.stdout = open(os.devnull, 'w')
+    random.seed(seed)
+    np.random.seed(seed)
+    cable_struct = load_cable_data(data_file)
+    num_devices = cs.calculate_num_devices(cable_struct)
+    trajectory = Trajectory()
+    try:
+        outcome = ENGINE_RUNNERS[engine](cable_struct, num_devices, time_limit, seed, trajectory)
+        status = 'ok'
+    except Exception as error:
+        outcome = {'evaluations': None, 'unit': '', 'proven': False}
+        status = f'error: {error}'
+    run_time = trajectory.elapsed()
+    time.sleep(2 * WATCH_INTERVAL)   # Allow a last poll of the shared best solution
+    results.put({'status': status, 'devices': num_devices, 'run_time': run_time, 'points': trajectory.points,
+                 'peak_memory_mb': peak_memory_mb(), **outcome})
+
+def run_isolated(engine, data_file, time_limit, seed):   # Run a case in a new process, terminating it if it doesn't stop in time
+    context = mp.get_context('spawn')   # A fresh process, so memory use and imported solver libraries don't carry over between runs
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(engine, data_file, time_limit, seed, mp.get_start_method(), results))
+    process.start()
+    try:
+        result = results.get(timeout=time_limit + GRACE_TIME)
+    except Exception:   # queue.Empty
+        result = {'status': 'timeout', 'devices': None, 'run_time': None, 'points': [], 'peak_memory_mb': None,
+                  'evaluations': None, 'unit': '', 'proven': False}
+    process.join(timeout=GRACE_TIME)
+    if process.is_alive():
+        process.terminate()
+    return result
+
+def find_optima(data_files):   # Optimal length for each data file, by dynamic programming, where the number of devices allows
+    import Cables_Model_6_dynamic_programming as dp
+    optima = {}
+    for data_file in data_files:
+        cable_struct = load_cable_data(data_file)
+        num_devices = cs.calculate_num_devices(cable_struct)
+        if num_devices <= dp.MAX_DEVICES:
+            weights = dp.calculate_weights(cable_struct, num_devices)
+            optima[data_file] = int(dp.solve(dp.calculate_cuts(weights, num_devices), num_devices)[-1])
+        else:
+            optima[data_file] = None
+    return optima
+
+def make_row(data_file, engine, seed, optimum, result):   # One row of the results file
+    points = result['points']
+    best_length = points[-1][1] if points else None
+    run_time = result['run_time']
+    evaluations = result['evaluations']
+    return {'data': data_file, 'devices': result['devices'], 'engine': engine, 'seed': seed, 'time_limit': TIME_LIMIT,
+            'status': result['status'], 'best_length': best_length, 'optimum': optimum,
+            'gap': (best_length - optimum) / optimum if best_length is not None and optimum else None,
+            'proven': result['proven'],
+            'time_to_first': points[0][0] if points else None,
+            'time_to_best': points[-1][0] if points else None,
+            'run_time': run_time, 'evaluations': evaluations,
+            'throughput': evaluations / run_time if evaluations is not None and run_time else None,
+            'unit': result['unit'], 'peak_memory_mb': result['peak_memory_mb']}
+
+def print_header():    # Header for progress updates
+    print('Cables benchmark\n')
+    print(f'Data files: {len(DATA_FILES)}, engines: {len(ENGINES)}, seeds: {len(SEEDS)}, time limit: {TIME_LIMIT} seconds per run\n')
+    print('Data      Engine                        Seed    Best  Optimum      Gap    First     Best   Memory')
+    print('------------------------------------------------------------------------------------------------')
+
+def format_value(value, spec, width):   # Format a value that may be missing
+    return f'{value:{spec}}'.rjust(width) if value is not None else '-'.rjust(width)
+
+def print_progress(row):   # Print the result of one run
+    print(f'{row["data"]:<8}  {ENGINE_NAMES[row["engine"]]:<28}  {row["seed"]:>4}  {format_value(row["best_length"], ",.0f", 6)}'
+          f'  {format_value(row["optimum"], ",.0f", 7)}  {format_value(row["gap"], ".2%", 7)}  {format_value(row["time_to_first"], ",.2f", 7)}'
+          f'  {format_value(row["time_to_best"], ",.2f", 7)}  {format_value(row["peak_memory_mb"], ",.0f", 7)}',
+          '' if row['status'] == 'ok' else row['status'])
+
+def mean(values):   # Mean of the values that aren't missing
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+def summarize(rows):   # Summary tables: each engine over all data files, and the gap of each engine on each data file
+    lines = ['Engine                        Runs  Optimal  Mean gap  Mean first  Mean best  Max memory']
+    lines.append('-' * len(lines[0]))
+    for engine in ENGINES:
+        engine_rows = [row for row in rows if row['engine'] == engine]
+        if not engine_rows:
+            continue
+        optimal = sum(1 for row in engine_rows if row['best_length'] is not None and row['best_length'] == row['optimum'])
+        memory = [row['peak_memory_mb'] for row in engine_rows if row['peak_memory_mb'] is not None]
+        lines.append(f'{ENGINE_NAMES[engine]:<28}  {len(engine_rows):>4}  {optimal:>7}  {format_value(mean(row["gap"] for row in engine_rows), ".2%", 8)}'
+                     f'  {format_value(mean(row["time_to_first"] for row in engine_rows), ",.2f", 10)}'
+                     f'  {format_value(mean(row["time_to_best"] for row in engine_rows), ",.2f", 9)}  {format_value(max(memory) if memory else None, ",.0f", 10)}')
+    lines.append('\nMean gap by data file')
+    heading = f'{"Data":<8}  {"Devices":>7}' + ''.join(f'  {engine:>11}' for engine in ENGINES)
+    lines.append(heading)
+    lines.append('-' * len(heading))
+    for data_file in DATA_FILES:
+        data_rows = [row for row in rows if row['data'] == data_file]
+        if not data_rows:
+            continue
+        devices = next((row['devices'] for row in data_rows if row['devices'] is not None), None)
+        lines.append(f'{data_file:<8}  {format_value(devices, "d", 7)}' +
+                     ''.join(f'  {format_value(mean(row["gap"] for row in data_rows if row["engine"] == engine), ".2%", 11)}' for engine in ENGINES))
+    return '\n'.join(lines)
+
+def main():
+    print_header()
+    optima = find_optima(DATA_FILES)
+    rows = []
+    with open(RESULTS_FILENAME, 'w', newline='') as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=FIELDS)
+        writer.writeheader()
+        for data_file in DATA_FILES:
+            for engine in ENGINES:
+                for seed in SEEDS:
+                    row = make_row(data_file, engine, seed, optima[data_file], run_isolated(engine, data_file, TIME_LIMIT, seed))
+                    rows.append(row)
+                    writer.writerow(row)
+                    results_file.flush()   # Keep the results of finished runs, if the benchmark is stopped part way
+                    print_progress(row)
+    summary = summarize(rows)
+    print(f'\n{summary}')
+    with open(SUMMARY_FILENAME, 'w') as summary_file:
+        summary_file.write(summary + '\n')
+    print(f'\nResults written to {RESULTS_FILENAME} and {SUMMARY_FILENAME}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Cabling management: Generate a large rack of devices
+# Creates synthetic data with many more devices than the hand-written data files, to test how the models scale.
+# Devices are connected at random, except that a share of the connections are between devices that are close together in a hidden order.
+# So, like a real rack, the data has structure that a good layout can exploit. The length of the hidden order is an upper bound on the minimum length.
+# The data is saved as a NumPy edge list, data/data_<devices>.npz, which the models load with cable_data.load_cable_data('data_<devices>').
+
+import os
+import time
+import numpy as np
+
+import cable_data
+
+# Constants
+NUM_DEVICES = 1000   # Number of devices in the rack, typically 100 to 5,000
+DENSITY = 6   # Average number of other devices that each device is connected to
+MAX_CABLES = 4   # Each connection has between 1 and MAX_CABLES cables
+LOCALITY = 0.8   # Share of connections between devices that are close together in the hidden order
+NEIGHBOURHOOD = 10   # Local connections are to devices up to this many positions away in the hidden order
+SEED = 1   # Random seed, so the same data can be created again
+
+def generate_pairs(rng, num_devices, num_connections, hidden):   # Distinct pairs of connected devices, as a (connections x 2) array with the lower device first
+    pairs = np.empty((0, 2), dtype=np.int64)
+    while len(pairs) < num_connections:   # Duplicates are removed, so top up until there are enough connections
+        needed = num_connections - len(pairs)
+        num_local = rng.binomial(needed, LOCALITY)
+        position = rng.integers(0, num_devices, num_local)
+        neighbour = position + rng.integers(1, NEIGHBOURHOOD + 1, num_local)
+        local = np.column_stack((hidden[position], hidden[np.minimum(neighbour, num_devices - 1)]))
+        remote = rng.integers(0, num_devices, (needed - num_local, 2))
+        new_pairs = np.vstack((local, remote))
+        new_pairs = new_pairs[new_pairs[:, 0] != new_pairs[:, 1]]   # A device connected to itself contributes no length
+        pairs = np.unique(np.vstack((pairs, np.sort(new_pairs, axis=1))), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:num_connections]]
+    isolated = np.setdiff1d(np.arange(num_devices), pairs)   # Every device needs at least one connection, so that it is in the data
+    partners = (isolated + rng.integers(1, num_devices, len(isolated))) % num_devices
+    pairs = np.vstack((pairs, np.sort(np.column_stack((isolated, partners)), axis=1)))
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+def generate(num_devices, density, max_cables, seed):   # Device from, device to, and cables arrays, plus the hidden order
+    rng = np.random.default_rng(seed)
+    hidden = rng.permutation(num_devices)   # hidden[position] = device
+    pairs = generate_pairs(rng, num_devices, num_devices * density // 2, hidden)
+    cables = rng.integers(1, max_cables + 1, len(pairs))
+    order = np.empty(num_devices, dtype=np.int64)
+    order[hidden] = np.arange(num_devices)   # order[device] = position, as in the models
+    return pairs[:, 0], pairs[:, 1], cables, order
+
+def main():
+    start_time = time.time()
+    device_from, device_to, cables, order = generate(NUM_DEVICES, DENSITY, MAX_CABLES, SEED)
+    filename = os.path.join(cable_data.DATA_FOLDER, f'data_{NUM_DEVICES}.npz')
+    cable_data.save_npz(filename, device_from, device_to, cables)
+    print('Cables: Generate data\n')
+    print(f'Devices:     {NUM_DEVICES:,.0f}, named A to {cable_data.index_to_letter(NUM_DEVICES - 1)}')
+    print(f'Connections: {len(cables):,.0f}')
+    print(f'Cables:      {cables.sum():,.0f}')
+    print(f'Hidden order length: {(np.abs(order[device_from] - order[device_to]) * cables).sum():,.0f}')
+    print(f'File:        {filename}, {os.path.getsize(filename):,.0f} bytes')
+    print(f'Time:        {time.time() - start_time:,.2f} seconds')
+
+if __name__ == "__main__":
+    main()
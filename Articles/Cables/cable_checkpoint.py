@@ -0,0 +1,29 @@
+# Cabling management: checkpoints for long-running searches
+# Each worker saves its own state - random generator state, best solution, and counters - to its own small binary file, so workers never wait for each other.
+# A checkpoint is written to a temporary file and then renamed, so a run that is interrupted while writing still leaves the previous checkpoint intact.
+# A resumed worker restores its random generator state, so it continues its sequence of samples rather than repeating the samples it made before the checkpoint.
+
+import os
+import glob
+import pickle
+
+def checkpoint_filename(folder, worker):   # File for one worker's checkpoint
+    return os.path.join(folder, f'worker_{worker:03d}.pkl')
+
+def save_checkpoint(folder, checkpoint):   # Save a worker's state, replacing its previous checkpoint
+    os.makedirs(folder, exist_ok=True)
+    filename = checkpoint_filename(folder, checkpoint['worker'])
+    with open(f'{filename}.tmp', 'wb') as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{filename}.tmp', filename)
+
+def load_checkpoints(folder):   # State of each worker, in worker order. Empty if there are no checkpoints
+    checkpoints = []
+    for filename in sorted(glob.glob(os.path.join(folder, 'worker_*.pkl'))):
+        with open(filename, 'rb') as file:
+            checkpoints.append(pickle.load(file))
+    return checkpoints
+
+def clear_checkpoints(folder):   # Remove the checkpoints of a previous run, so they aren't mixed with a new run
+    for filename in glob.glob(os.path.join(folder, 'worker_*.pkl*')):
+        os.remove(filename)
@@ -0,0 +1,83 @@
+# Cabling management: data files shared by the Cables models
+# Data is either:
+# - A Python file, like data/data_08.py, with a list cable_struct of [device_from, device_to, cables].
+# - A NumPy edge list, like data/data_1000.npz, with arrays device_from, device_to, and cables. Created by Cables_generate_data.py.
+# The .npz files are saved uncompressed, so each array is memory-mapped rather than read into memory. np.load doesn't memory-map .npz files, so we find each array in the zip file ourselves.
+# A .npz file is loaded as an EdgeList, which keeps the arrays memory-mapped. It iterates like the list in a Python file, for the models that loop over the connections,
+# while edge_arrays gives the arrays themselves to the models that score with NumPy. When an EdgeList is passed to another process, that process maps the same file.
+# Devices are named like spreadsheet columns: A to Z, then AA, AB, ..., ZZ, AAA, etc, so any number of devices can be named.
+
+import os
+import struct
+import zipfile
+import importlib.util
+import numpy as np
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')   # Folder of data files, in the Cables folder whatever the current folder is
+EDGE_ARRAYS = ('device_from', 'device_to', 'cables')   # Arrays in a .npz data file
+ZIP_LOCAL_HEADER_SIZE = 30   # Fixed part of the header before each file in a zip archive
+ITER_BLOCK = 65536   # Number of connections converted to Python ints at a time when iterating over an EdgeList
+
+def index_to_letter(index):   # Convert number to name: 0 is 'A', 25 is 'Z', 26 is 'AA', etc
+    name = ''
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord('A') + remainder) + name
+    return name
+
+def save_npz(filename, device_from, device_to, cables):   # Save an edge list, uncompressed so that it can be memory-mapped
+    np.savez(filename, device_from=np.asarray(device_from, dtype=np.int32), device_to=np.asarray(device_to, dtype=np.int32),
+             cables=np.asarray(cables, dtype=np.int32))
+
+def load_npz(filename):   # Memory-map each array of an uncompressed .npz file, as a dictionary of name: array
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{filename} is compressed, so it can\'t be memory-mapped. Save it with save_npz')
+            file.seek(info.header_offset)
+            header = file.read(ZIP_LOCAL_HEADER_SIZE)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            file.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)   # Start of the .npy file
+            version = np.lib.format.read_magic(file)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(file)
+            arrays[info.filename.removesuffix('.npy')] = np.memmap(filename, dtype=dtype, mode='r', offset=file.tell(), shape=shape,
+                                                                   order='F' if fortran_order else 'C')
+    return arrays
+
+class EdgeList:   # Cable structure from a .npz file, as memory-mapped arrays. Iterates over (device_from, device_to, cables) tuples of Python ints
+    def __init__(self, filename):
+        self.filename = filename
+        arrays = load_npz(filename)
+        self.device_from, self.device_to, self.cables = (arrays[a] for a in EDGE_ARRAYS)
+
+    def __len__(self):
+        return len(self.cables)
+
+    def __iter__(self):   # Convert a block at a time, rather than one NumPy scalar at a time
+        for start in range(0, len(self), ITER_BLOCK):
+            end = start + ITER_BLOCK
+            yield from zip(self.device_from[start:end].tolist(), self.device_to[start:end].tolist(), self.cables[start:end].tolist())
+
+    def __getitem__(self, index):
+        return int(self.device_from[index]), int(self.device_to[index]), int(self.cables[index])
+
+    def __reduce__(self):   # Pickle as the file name, so another process maps the file rather than receiving a copy of the arrays
+        return EdgeList, (self.filename,)
+
+def edge_arrays(cable_structure):   # Arrays of from devices, to devices, and cables. Memory-mapped for an EdgeList, otherwise converted from the list
+    if isinstance(cable_structure, EdgeList):
+        return cable_structure.device_from, cable_structure.device_to, cable_structure.cables
+    cable_array = np.array(cable_structure, dtype=np.int64).reshape(-1, 3)
+    return cable_array[:, 0], cable_array[:, 1], cable_array[:, 2]
+
+def load_cable_data(name):   # Cable structure from data/<name>.npz if it exists, as an EdgeList, otherwise data/<name>.py, as a list of [device_from, device_to, cables]
+    filename = os.path.join(DATA_FOLDER, f'{name}.npz')
+    if os.path.exists(filename):
+        return EdgeList(filename)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(DATA_FOLDER, f'{name}.py'))   # Load by path, like the .npz file, rather than through sys.path
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.cable_struct
@@ -0,0 +1,178 @@
+# Cabling management: search engine shared by the Cables models
+# A layout is held as order[device] = position and devices[position] = device, so each move is scored from only the cables attached to the devices that it moves.
+# Neighbourhoods:
+# - swap: exchange the positions of two devices.
+# - insert: move one device to another position, shifting the devices in between by one position.
+# - reverse: reverse the order of a block of adjacent positions.
+# Methods:
+# - Simulated annealing, with an exponential cooling schedule over each restart cycle.
+# - Tabu search with aspiration, over a random sample of the neighbourhood at each iteration.
+# Each method runs until a given time, so that a driver can co-ordinate processes between calls. The driver's shared best solution is also defined here.
+
+import time
+import math
+import random
+import multiprocessing as mp
+
+from cable_data import index_to_letter   # Used by the models that import this module
+import cable_telemetry as ct
+
+NO_SOLUTION = 2**62   # Shared best length before any solution is found
+TIME_CHECK_MOVES = 100   # Number of moves between checks of the time
+
+
+def calculate_num_devices(cable_structure):   # Number of devices in input data
+    return max(max(device_from, device_to) for device_from, device_to, _ in cable_structure) + 1
+
+def calculate_total_length(order, cable_structure):   # Total cable length of current solution
+    return sum(abs((order[device_from] - order[device_to]) * cables) for device_from, device_to, cables in cable_structure)
+
+def build_adjacency(cable_structure, num_devices):   # For each device, a list of (connected device, cables). Duplicate connections are combined
+    adjacency = [dict() for _ in range(num_devices)]
+    for device_from, device_to, cables in cable_structure:
+        if device_from != device_to:   # A device connected to itself contributes no length
+            adjacency[device_from][device_to] = adjacency[device_from].get(device_to, 0) + cables
+            adjacency[device_to][device_from] = adjacency[device_to].get(device_from, 0) + cables
+    return [list(neighbours.items()) for neighbours in adjacency]
+
+# Shared best solution, for a pool of processes
+def create_shared_state(num_devices):   # Best solution and progress shared by the processors, in shared memory
+    return {'lock': mp.Lock(),
+            'min_length': mp.RawValue('q', NO_SOLUTION),
+            'best_case': mp.RawArray('i', range(num_devices))}
+
+def init_worker(state, events=None):   # Shared memory and the telemetry queue must be passed to each process when it starts, rather than as a task argument
+    global shared_state
+    shared_state = state
+    ct.init_telemetry(events)
+
+def update_incumbent(length, case):   # Atomic compare-and-update of the shared best solution. Returns True if the solution is a new best
+    if length >= shared_state['min_length'].value:   # Cheap check without the lock; the best length only ever decreases
+        return False
+    with ct.acquire(shared_state['lock']):
+        if length < shared_state['min_length'].value:
+            shared_state['min_length'].value = length
+            shared_state['best_case'][:] = case
+            return True
+    return False
+
+def read_incumbent():   # Copy of the shared best solution. The lock ensures that the order isn't read part way through an update
+    with ct.acquire(shared_state['lock']):
+        return shared_state['min_length'].value, list(shared_state['best_case'])
+
+# Neighbourhoods
+def random_move(num_devices, moves):   # Random move (kind, a, b), where a and b are different positions
+    a, b = random.sample(range(num_devices), 2)
+    kind = random.choice(moves)
+    if kind == 'reverse' and a > b:
+        a, b = b, a
+    return kind, a, b
+
+def move_positions(devices, move):   # New position of each device moved by a move, as a dictionary of device: position
+    kind, a, b = move
+    if kind == 'swap':
+        return {devices[a]: b, devices[b]: a}
+    if kind == 'insert':
+        moved = {devices[a]: b}
+        step = -1 if a < b else 1   # Devices between a and b shift one position towards a
+        for p in range(min(a, b), max(a, b) + 1):
+            if p != a:
+                moved[devices[p]] = p + step
+        return moved
+    return {devices[p]: a + b - p for p in range(a, b + 1)}   # reverse
+
+class LayoutSearch:   # Current and best layouts for one process, with moves scored incrementally
+    def __init__(self, cable_structure, num_devices, moves, cycle_length):
+        self.cable_structure = cable_structure
+        self.num_devices = num_devices
+        self.adjacency = build_adjacency(cable_structure, num_devices)
+        self.moves = moves   # Neighbourhoods to use, from 'swap', 'insert', 'reverse'
+        self.cycle_length = cycle_length   # Time from a restart until annealing reaches its end temperature, seconds
+        self.best_length = NO_SOLUTION
+        self.best_order = list(range(num_devices))
+        self.accepted = 0   # Moves made, over all restarts
+        self.reset(list(range(num_devices)))
+
+    def reset(self, order):   # Continue the search from a new order
+        self.order = list(order)
+        self.devices = [0] * self.num_devices
+        for device, position in enumerate(self.order):
+            self.devices[position] = device
+        self.length = calculate_total_length(self.order, self.cable_structure)
+        self.cycle_start = time.time()
+        self.iteration = 0
+        self.tabu_until = {}   # (device, position): iteration until which the device may not return to that position
+        self.note_best()
+
+    def note_best(self):   # Record the current layout if it is the best found by this process
+        if self.length < self.best_length:
+            self.best_length = self.length
+            self.best_order = self.order[:]
+
+    def delta(self, moved):   # Change in total cable length from moving devices to new positions
+        order = self.order
+        delta = 0
+        for v, new_v in moved.items():
+            old_v = order[v]
+            for k, cables in self.adjacency[v]:
+                if k in moved:
+                    if v < k:   # Cable between two moved devices, counted once
+                        delta += cables * (abs(new_v - moved[k]) - abs(old_v - order[k]))
+                else:
+                    delta += cables * (abs(new_v - order[k]) - abs(old_v - order[k]))
+        return delta
+
+    def apply(self, moved, delta):   # Make a move, in place
+        for v, position in moved.items():
+            self.order[v] = position
+            self.devices[position] = v
+        self.length += delta
+        self.accepted += 1
+
+    def initial_temperature(self, acceptance, samples = 200):   # Temperature at which an average worsening move is accepted with the given probability
+        worse = [d for d in (self.delta(move_positions(self.devices, random_move(self.num_devices, self.moves))) for _ in range(samples)) if d > 0]
+        average = sum(worse) / len(worse) if worse else 1
+        return -average / math.log(acceptance)
+
+    def anneal(self, until, start_temp, end_temp):   # Simulated annealing until the given time. Returns number of moves evaluated
+        count = 0
+        temperature = start_temp
+        while True:
+            if count % TIME_CHECK_MOVES == 0:
+                current_time = time.time()
+                if current_time >= until:
+                    break
+                progress = min(1, (current_time - self.cycle_start) / self.cycle_length)
+                temperature = start_temp * (end_temp / start_temp) ** progress   # Exponential cooling over the restart cycle
+            moved = move_positions(self.devices, random_move(self.num_devices, self.moves))
+            delta = self.delta(moved)
+            if delta <= 0 or random.random() < math.exp(-delta / temperature):
+                self.apply(moved, delta)
+                if delta < 0:
+                    self.note_best()
+            count += 1
+        return count
+
+    def tabu(self, until, tenure, sample_size):   # Tabu search until the given time. Returns number of moves evaluated
+        count = 0
+        while time.time() < until:
+            self.iteration += 1
+            best_move = None
+            best_delta = None
+            for _ in range(sample_size):   # Best admissible move in a sample of the neighbourhood
+                moved = move_positions(self.devices, random_move(self.num_devices, self.moves))
+                delta = self.delta(moved)
+                count += 1
+                if best_delta is not None and delta >= best_delta:
+                    continue
+                is_tabu = any(self.tabu_until.get((v, p), 0) > self.iteration for v, p in moved.items())
+                if is_tabu and self.length + delta >= self.best_length:   # Aspiration: a tabu move is allowed if it finds a new best
+                    continue
+                best_move, best_delta = moved, delta
+            if best_move is None:
+                continue
+            for v in best_move:   # Moved devices may not return to their old positions for a while
+                self.tabu_until[(v, self.order[v])] = self.iteration + tenure
+            self.apply(best_move, best_delta)
+            self.note_best()
+        return count
@@ -0,0 +1,130 @@
+# Cabling management: telemetry for the parallel searches
+# Each worker counts its activity in local variables and, at a short interval, puts a small event on a queue: moves evaluated, moves accepted, restarts, and time spent waiting for the shared lock.
+# A worker also puts an event on the queue each time it finds a new best solution. Workers don't print.
+# A collector thread in the main process reads the queue, prints progress at each update interval, and writes every event to a JSON lines file, with:
+# - Per-worker rates for each progress event: evaluations and accepted moves per second, and the share of time spent waiting for the lock.
+# - The incumbent trajectory: the time, worker, and length of each new best solution.
+# - A summary of each worker's totals, and of all workers together, when the search finishes.
+
+import os
+import json
+import time
+import queue
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+
+TELEMETRY_INTERVAL = 1   # Time interval for each worker's progress events, seconds
+TELEMETRY_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telemetry.jsonl')   # Default file for the events, in the Cables folder
+
+event_queue = None   # Queue to the collector, set in each worker by init_telemetry
+worker_id = 0   # Number of this worker: 1, 2, ... in a pool
+lock_wait = 0.0   # Time this worker has spent waiting for the shared lock since its last progress event, seconds
+
+def create_queue():   # Queue for events from the workers to the collector
+    return mp.Queue()
+
+def init_telemetry(events):   # Called in each worker when it starts
+    global event_queue, worker_id
+    event_queue = events
+    identity = mp.current_process()._identity
+    worker_id = identity[0] if identity else 0
+
+def emit(kind, **fields):   # Put an event on the queue, if there is a collector
+    if event_queue is not None:
+        event_queue.put({'kind': kind, 'worker': worker_id, 'time': time.time(), **fields})
+
+def report_progress(evaluated, accepted=0, restarts=0):   # Progress since this worker's previous progress event
+    global lock_wait
+    emit('progress', evaluated=evaluated, accepted=accepted, restarts=restarts, lock_wait=lock_wait)
+    lock_wait = 0.0
+
+def report_incumbent(length):   # A new best solution, found by this worker
+    emit('incumbent', length=int(length))
+
+@contextmanager
+def acquire(lock):   # Hold a lock, counting the time spent waiting for it
+    global lock_wait
+    wait_start = time.perf_counter()
+    with lock:
+        lock_wait += time.perf_counter() - wait_start
+        yield
+
+class Collector:   # Reads events from the workers, in a thread of the main process
+    def __init__(self, events, start_time, update_interval, pct_done, print_progress, filename=TELEMETRY_FILENAME, initial_count=0):
+        self.events = events
+        self.start_time = start_time   # Start of the run, moved back by the time before the checkpoint when resuming
+        self.rate_start_time = time.time()   # Start of this collector. Rates are from here, as the evaluation counts don't include those before a checkpoint
+        self.update_interval = update_interval
+        self.pct_done = pct_done   # Function of elapsed time and total evaluations, for progress updates
+        self.print_progress = print_progress   # The model's function, with arguments elapsed_time, min_length, pct_done, new_best
+        self.filename = filename
+        self.workers = {}   # Totals for each worker
+        self.total_count = initial_count   # Evaluations by all workers, including any before a resumed run
+        self.min_length = None
+        self.new_best = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):   # Wait until all events have been written. Call after the workers have finished
+        self.events.put(None)
+        self.thread.join()
+
+    def run(self):
+        last_update = time.time()
+        with open(self.filename, 'w') as file:
+            while True:
+                try:
+                    event = self.events.get(timeout=max(0.01, last_update + self.update_interval - time.time()))
+                except queue.Empty:
+                    event = {}
+                if event is None:
+                    break
+                if event:
+                    file.write(json.dumps(self.record(event)) + '\n')
+                if time.time() - last_update >= self.update_interval and self.min_length is not None:
+                    elapsed_time = time.time() - self.start_time
+                    self.print_progress(elapsed_time, self.min_length, self.pct_done(elapsed_time, self.total_count), self.new_best)
+                    self.new_best = False
+                    last_update += self.update_interval
+            for summary in self.summaries():
+                file.write(json.dumps(summary) + '\n')
+
+    def record(self, event):   # Add an event to the totals, returning it with elapsed time and rates
+        worker = self.workers.setdefault(event['worker'], {'evaluated': 0, 'accepted': 0, 'restarts': 0, 'lock_wait': 0.0, 'incumbents': 0,
+                                                           'last_time': self.rate_start_time})
+        event['elapsed'] = event['time'] - self.start_time
+        if event['kind'] == 'progress':
+            interval = max(event['time'] - worker['last_time'], 1e-9)
+            worker['last_time'] = event['time']
+            for key in ('evaluated', 'accepted', 'restarts', 'lock_wait'):
+                worker[key] += event[key]
+            self.total_count += event['evaluated']
+            event['rate'] = event['evaluated'] / interval
+            event['accept_rate'] = event['accepted'] / interval
+            event['lock_wait_share'] = event['lock_wait'] / interval
+        elif event['kind'] == 'incumbent':
+            worker['incumbents'] += 1
+            if self.min_length is None or event['length'] < self.min_length:
+                self.min_length = event['length']
+                self.new_best = True
+        return event
+
+    def summaries(self):   # Totals and rates for each worker, and for all workers together
+        run_time = max(time.time() - self.rate_start_time, 1e-9)   # Time of this run, excluding any before a checkpoint
+        totals = {'evaluated': 0, 'accepted': 0, 'restarts': 0, 'lock_wait': 0.0, 'incumbents': 0}
+        summaries = []
+        for worker_number, worker in sorted(self.workers.items()):
+            for key in totals:
+                totals[key] += worker[key]
+            summaries.append(self.summary(worker_number, worker, run_time, 1))
+        summaries.append(self.summary('all', totals, run_time, max(1, len(self.workers))))
+        return summaries
+
+    def summary(self, worker_number, totals, run_time, num_workers):
+        return {'kind': 'summary', 'worker': worker_number, 'run_time': run_time, **{key: totals[key] for key in ('evaluated', 'accepted', 'restarts', 'lock_wait', 'incumbents')},
+                'rate': totals['evaluated'] / run_time, 'accept_rate': totals['accepted'] / run_time,
+                'lock_wait_share': totals['lock_wait'] / (run_time * num_workers), 'min_length': self.min_length}
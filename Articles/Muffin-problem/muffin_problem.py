@@ -7,6 +7,9 @@ import math as math
 from functools import reduce
 import multiprocessing as mp
 from datetime import datetime
+import os
+import json
+import queue
 
 # Run constants
 UB_MUFFINS = 9  # Number of muffins
@@ -23,6 +26,12 @@ MODEL_NAME = 'Muffin cutting'
 FRACTION_LIMIT = 1000  # Keep fractions to smallish values
 NUM_PROCESSES = 16  # Number of processes to run in parallel, limited by number of CPUs
 
+# Cache constants
+USE_CACHE = True  # Reuse results from earlier runs, rather than solving those cases again
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'muffin_cache.jsonl')  # Results of solved cases, one JSON record per line, next to this script
+FORMULATION_VERSION = 1  # Increase when setup_model changes, so that results from an earlier formulation aren't reused
+WARM_START = True  # Start each case from a solution built from a solved smaller case, if there is one
+
 # Derived globals
 PROCESSES_TO_USE = min(NUM_PROCESSES, mp.cpu_count())
 
@@ -47,7 +56,119 @@ def show_as_lcd(f, lcd_value):  # Convert a fraction to the given least common d
     numerator = str(f.numerator * (lcd_value // f.denominator)).rjust(len(str(lcd_value)), ' ')
     return f'{numerator}/{lcd_value}'
 
-def setup_model(num_muffins, num_students):  # Create the optimization model
+def floor_ceiling_bound(num_muffins, num_students):  # Upper bound on the smallest piece, from the Floor-Ceiling theorem, for m > s where s doesn't divide m
+    ratio = Fraction(2 * num_muffins, num_students)
+    return max(Fraction(1, 3), min(Fraction(num_muffins, num_students * math.ceil(ratio)), 1 - Fraction(num_muffins, num_students * math.floor(ratio))))
+
+def known_result(num_muffins, num_students, cache):  # Smallest piece from closed-form results and bounds, or None if the case needs to be solved
+    if num_muffins % num_students == 0:
+        return Fraction(1)  # Each student gets whole muffins
+    if (2 * num_muffins) % num_students == 0:
+        return Fraction(1, 2)  # Cut every muffin in half. The Floor-Ceiling bound is also 1/2
+    upper_bound = floor_ceiling_bound(num_muffins, num_students)
+    if upper_bound == Fraction(1, 3):
+        return upper_bound  # Meets the lower bound of 1/3 for m > s
+    if scaled_lower_bound(num_muffins, num_students, cache) == upper_bound:
+        return upper_bound
+    return None
+
+def scaled_lower_bound(num_muffins, num_students, cache):  # The solution for (m/g, s/g), where g = gcd(m, s), repeated g times is a solution for (m, s)
+    divisor = math.gcd(num_muffins, num_students)
+    if divisor == 1:
+        return Fraction(0)
+    reduced = (num_muffins // divisor, num_students // divisor)
+    result = known_result(*reduced, cache)
+    if result is None:
+        record = cached_result(*reduced, cache)
+        result = Fraction(record['smallest']) if record is not None else Fraction(0)  # A cached result is feasible, even if it isn't optimal
+    return result
+
+def read_cache(filename):  # Cached results, keyed by (muffins, students, time limit, formulation version)
+    cache = {}
+    if USE_CACHE and os.path.exists(filename):
+        with open(filename, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # Incomplete line from an interrupted run
+                    continue
+                cache[(record['muffins'], record['students'], record['time_limit'], record['version'])] = record  # A later result for the same key replaces an earlier one
+    return cache
+
+def cached_result(num_muffins, num_students, cache):  # Result for this time limit and formulation. An optimal result is reused with any time limit
+    record = cache.get((num_muffins, num_students, TIME_LIMIT, FORMULATION_VERSION))
+    if record is None:
+        optimal = [r for key, r in cache.items() if key[0:2] == (num_muffins, num_students) and key[3] == FORMULATION_VERSION and r['status'] == '*']
+        record = optimal[0] if optimal else None
+    return record
+
+def write_cache(filename, lock, record):  # Append a result to the cache. Workers share the file, so hold the lock while writing
+    if USE_CACHE:
+        with lock:
+            with open(filename, 'a') as file:
+                file.write(json.dumps(record) + '\n')
+
+def solve_times(cache):  # Longest previous solve time for each case, with any time limit or formulation
+    times = {}
+    for key, record in cache.items():
+        times[key[0:2]] = max(times.get(key[0:2], 0), record['run_time'])
+    return times
+
+def schedule(open_cases, cache):  # Order the open cases longest first, so the slowest cases don't start last and stretch the elapsed time
+    times = solve_times(cache)
+    def predicted(case):  # Cases without a previous solve time go first, largest first, as they might be slow
+        i, num_muffins, num_students, lower_bound = case
+        return (times.get((num_muffins, num_students), math.inf), num_muffins * num_students)
+    return sorted(open_cases, key=predicted, reverse=True)
+
+def cached_solutions(cache):  # Best cached solution for each case. A solution is feasible with any time limit or formulation
+    solutions = {}
+    for key, record in cache.items():
+        if 'solution' in record and record['objective'] > solutions.get(key[0:2], (-1, None))[0]:
+            solutions[key[0:2]] = (record['objective'], record['solution'])
+    return {case: solution for case, (objective, solution) in solutions.items()}
+
+def smallest_piece(sizes):
+    return min(size for row in sizes for size in row if size > 0)
+
+def symmetric_order(sizes):  # Reorder muffins and students to satisfy the symmetry-breaking constraints, or None if sorting doesn't settle
+    for _ in range(len(sizes) + len(sizes[0])):
+        sizes = sorted(sizes, key=lambda row: row[0])  # Muffins in order of their piece for student 1
+        order = sorted(range(len(sizes[0])), key=lambda s: sizes[0][s])  # Students in order of their piece of muffin 1
+        sizes = [[row[s] for s in order] for row in sizes]
+        if all(sizes[m][0] <= sizes[m + 1][0] for m in range(len(sizes) - 1)):
+            return sizes
+    return None
+
+def neighbours(num_muffins, num_students):  # Smaller cases that a starting solution can be built from: (m - s, s), and (m/g, s/g) where g = gcd(m, s)
+    result = [(num_muffins - num_students, num_students)]
+    divisor = math.gcd(num_muffins, num_students)
+    if divisor > 1:
+        result.append((num_muffins // divisor, num_students // divisor))
+    return result
+
+def neighbour_start(num_muffins, num_students, solutions_dict):  # Feasible starting solution built from a solved smaller case, or None if there isn't one
+    candidates = []
+    previous = (num_muffins - num_students, num_students)
+    if previous in solutions_dict:  # Add one whole muffin for each student
+        candidates.append(list(solutions_dict[previous]) + [[1 if s == t else 0 for s in range(num_students)] for t in range(num_students)])
+    divisor = math.gcd(num_muffins, num_students)
+    reduced = (num_muffins // divisor, num_students // divisor)
+    if divisor > 1 and reduced in solutions_dict:  # Repeat the solution of (m/g, s/g) for each of g groups of muffins and students
+        small = solutions_dict[reduced]
+        candidates.append([[small[m % reduced[0]][s % reduced[1]] if m // reduced[0] == s // reduced[1] else 0 for s in range(num_students)] for m in range(num_muffins)])
+    if not candidates:
+        return None
+    return symmetric_order(max(candidates, key=smallest_piece))
+
+def set_start(model, sizes):  # Give the solver a starting solution
+    for m in model.muffins:
+        for s in model.students:
+            model.size[m, s].value = sizes[m - 1][s - 1]
+            model.delta[m, s].value = 1 if sizes[m - 1][s - 1] > 0 else 0
+    model.smallest.value = smallest_piece(sizes)
+
+def setup_model(num_muffins, num_students, lower_bound=0):  # Create the optimization model
     model = ConcreteModel(name=MODEL_NAME)
     model.muffins = RangeSet(num_muffins)
     model.students = RangeSet(num_students)
@@ -78,14 +199,18 @@ def setup_model(num_muffins, num_students):  # Create the optimization model
         model.bounds.add(model.smallest <= 0.5)
     if num_muffins > num_students:
         model.bounds.add(model.smallest >= 1/3)
+    if num_muffins > num_students and not (num_muffins % num_students == 0):
+        model.bounds.add(model.smallest <= float(floor_ceiling_bound(num_muffins, num_students)))
+    if lower_bound > 0:
+        model.bounds.add(model.smallest >= float(lower_bound))  # From a smaller case, scaled up
 
     return model
 
-def solve_model(model):
+def solve_model(model, warm_start=False):
     solver = SolverFactory('appsi_highs')
     solver.options['time_limit'] = TIME_LIMIT
     solver.options['mip_rel_gap'] = 0
-    results = solver.solve(model, load_solutions=LOAD_SOLUTION, tee=VERBOSE)
+    results = solver.solve(model, load_solutions=LOAD_SOLUTION, tee=VERBOSE, warmstart=warm_start)
     return results
 
 def check_solution(model, results):   # Check if we obtained a valid solution
@@ -123,6 +248,10 @@ def display_case_result(case_num, num_muffins, num_students, results, model, lcd
     sizes_list = [f'{sum(1 for s in model.students for m in model.muffins if to_fraction(model.size[m, s]()) == size)}x{to_fraction(size)}' for size in distinct_sizes]
     sizes = ', '.join(sizes_list)
     run_time = (time_dict[case_num, 1] - time_dict[case_num, 0]).total_seconds()
+    print_case_row(case_num, num_muffins, num_students, run_time, current_solution, gap, condition, proper, sizes)
+    return current_solution, gap, proper, sizes
+
+def print_case_row(case_num, num_muffins, num_students, run_time, current_solution, gap, condition, proper, sizes):
     c = f'{case_num + 1:>4}'
     m = f'{num_muffins:>3}'
     s = f'{num_students:>3}'
@@ -134,7 +263,6 @@ def display_case_result(case_num, num_muffins, num_students, results, model, lcd
     p = f'{proper:>8}'
     z = f'{sizes}'
     print(f'{c}        {m}        {s}  {t}     {o}     {f}     {g}    {d}        {p}     {z}')
-    return current_solution, gap
 
 def case_result(case_num, num_muffins, num_students, model, results, write_solution, condition, time_dict):
     time_dict[case_num, 1] = datetime.now()
@@ -144,12 +272,14 @@ def case_result(case_num, num_muffins, num_students, model, results, write_solut
         lcd_value = lcd(all_fractions)
         distinct_sizes = sorted(set(all_fractions))
         per_student = calculate_total_muffins(model, num_muffins, num_students, distinct_sizes)
-        obj, gap = display_case_result(case_num, num_muffins, num_students, results, model, lcd_value, per_student, distinct_sizes, condition, time_dict)
+        obj, gap, proper, sizes = display_case_result(case_num, num_muffins, num_students, results, model, lcd_value, per_student, distinct_sizes, condition, time_dict)
     else:
         obj = -1
         gap = 0
+        proper = ''
+        sizes = ''
         print('No feasible solution found.')
-    return obj, gap
+    return obj, gap, proper, sizes
 
 def setup(args):
     num_muffins, num_students = args
@@ -158,18 +288,27 @@ def setup(args):
     print(f'-'*240)
     
 def tasks(args):
-    case_num, num_muffins, num_students, lock, results_dict, status_dict, time_dict = args
+    case_num, num_muffins, num_students, lower_bound, lock, results_dict, status_dict, time_dict, solutions_dict = args
     time_dict[case_num, 0] = datetime.now()
     try:
-        model = setup_model(num_muffins, num_students)
-        results = solve_model(model)
+        model = setup_model(num_muffins, num_students, lower_bound)
+        start = neighbour_start(num_muffins, num_students, solutions_dict) if WARM_START else None
+        if start is not None:
+            set_start(model, start)
+        results = solve_model(model, warm_start=start is not None)
         write_solution, condition = check_solution(model, results)
-        obj, gap = case_result(case_num, num_muffins, num_students, model, results, write_solution, condition, time_dict)
+        obj, gap, proper, sizes = case_result(case_num, num_muffins, num_students, model, results, write_solution, condition, time_dict)
         results_dict[(num_muffins, num_students)] = obj
         if obj == -1:
             status_marker = '.'
         else:
             status_marker = '*' if condition == 'optimal' else '-'
+            run_time = (time_dict[case_num, 1] - time_dict[case_num, 0]).total_seconds()
+            solution = [[float(to_fraction(model.size[m, s]())) for s in model.students] for m in model.muffins]  # Rounded, so tiny values like -1e-16 are 0
+            solutions_dict[(num_muffins, num_students)] = solution  # For warm starts of larger cases
+            write_cache(CACHE_FILE, lock, {'muffins': num_muffins, 'students': num_students, 'time_limit': TIME_LIMIT, 'version': FORMULATION_VERSION,
+                                           'smallest': str(to_fraction(obj)), 'objective': obj, 'gap': gap, 'condition': str(condition), 'status': status_marker,
+                                           'run_time': run_time, 'per_student': proper, 'sizes': sizes, 'solution': solution})
         status_dict[(num_muffins, num_students)] = status_marker
     except Exception as e:
         print(f'Error in task {case_num}: {e}')
@@ -218,6 +357,48 @@ def initialize_dicts(manager, ub_muffins, ub_students):
             status_dict[(num_muffins, num_students)] = '.'
     return results_dict, status_dict, time_dict
 
+def presolve(cases, cache, results_dict, status_dict, time_dict):  # Record the cases with known or cached results, returning the other cases with a lower bound for each
+    open_cases = []
+    for i, (num_muffins, num_students) in enumerate(cases):
+        time_dict[i, 0] = datetime.now()
+        time_dict[i, 1] = time_dict[i, 0]
+        known = known_result(num_muffins, num_students, cache)
+        record = cached_result(num_muffins, num_students, cache) if known is None else None
+        if known is not None:
+            results_dict[(num_muffins, num_students)] = float(known)
+            status_dict[(num_muffins, num_students)] = '*'
+            print_case_row(i, num_muffins, num_students, 0, float(known), 0, 'closed form', proper_fraction(Fraction(num_muffins, num_students)), '')
+        elif record is not None:
+            results_dict[(num_muffins, num_students)] = record['objective']
+            status_dict[(num_muffins, num_students)] = record['status']
+            print_case_row(i, num_muffins, num_students, record['run_time'], record['objective'], record['gap'], 'cached', record['per_student'], record['sizes'])
+        else:
+            open_cases.append((i, num_muffins, num_students, scaled_lower_bound(num_muffins, num_students, cache)))
+    return open_cases
+
+def waits_for(open_cases):  # For each open case, the other open cases that its warm start is built from, so it is solved after them
+    open_keys = {(num_muffins, num_students) for i, num_muffins, num_students, lower_bound in open_cases}
+    return {(num_muffins, num_students): [n for n in neighbours(num_muffins, num_students) if n in open_keys] if WARM_START else []
+            for i, num_muffins, num_students, lower_bound in open_cases}
+
+def solve_cases(pool, open_cases, lock, results_dict, status_dict, time_dict, solutions_dict):  # Hand the cases to the pool in order, each once the cases that it waits for are finished
+    waiting = list(open_cases)
+    depends = waits_for(open_cases)
+    finished = set()
+    completed = queue.Queue()  # Cases finished by the pool, put by the callback in the pool's result thread
+    running = 0
+    while waiting or running:
+        ready = [case for case in waiting if all(n in finished for n in depends[case[1:3]])]
+        for case in ready:
+            i, num_muffins, num_students, lower_bound = case
+            pool.apply_async(tasks, [(i, num_muffins, num_students, lower_bound, lock, results_dict, status_dict, time_dict, solutions_dict)],
+                             callback=lambda result, key=(num_muffins, num_students): completed.put(key),
+                             error_callback=lambda error, key=(num_muffins, num_students): completed.put(key))  # A failed case mustn't hold up the cases that wait for it
+            waiting.remove(case)
+            running += 1
+        finished.add(completed.get())
+        running -= 1
+
 def generate_cases(ub_muffins, ub_students):
     cases = [(num_muffins, num_students) for num_students in range(1, ub_students + 1) for num_muffins in range(num_students + 1, ub_muffins + 1)]
     return cases
@@ -230,8 +411,11 @@ if __name__ == '__main__':
     lock = manager.Lock()
     pool = mp.Pool(processes=PROCESSES_TO_USE)  # Create a pool with the user-input number of processes
     pool.map(func=setup, iterable=[(UB_MUFFINS, UB_STUDENTS)])  # Do one-off setup
+    cache = read_cache(CACHE_FILE)
+    open_cases = schedule(presolve(cases, cache, results_dict, status_dict, time_dict), cache)  # Only the open cases are solved, longest first
+    solutions_dict = manager.dict(cached_solutions(cache))
     try:
-        results = pool.map_async(tasks, [(i, case[0], case[1], lock, results_dict, status_dict, time_dict) for i, case in enumerate(cases)])
+        solve_cases(pool, open_cases, lock, results_dict, status_dict, time_dict, solutions_dict)
         pool.close()
         pool.join()
     except KeyboardInterrupt:
@@ -3,6 +3,7 @@
 # Import dependencies
 import pyomo.environ as pyo
 import pandas as pd
+import numpy as np
 import os.path
 from openpyxl import load_workbook
 from openpyxl.utils.cell import range_boundaries
@@ -14,30 +15,52 @@ Worksheet = 'Model 1'
 Engine = 'cbc'   # cbc, glpk, or appsi_highs
 TimeLimit = 60   # seconds
 
-# Generic loader from Excel file, given worksheet and named range
-def LoadFromExcel(ExcelFile, Worksheet, Range):
-    Workbook = load_workbook(filename=ExcelFile, read_only = True)
-    Sheet = Workbook[Worksheet]
-    NamesRanges = Workbook.defined_names[Range].destinations
-    for Title, Coord in NamesRanges:
-        MinCol, MinRow, MaxCol, MaxRow = range_boundaries(Coord)
-        Data = Sheet.iter_rows(MinRow, MaxRow, MinCol, MaxCol, values_only = True)
-    ExtractedData = pd.DataFrame(Data)
-    return ExtractedData
+# Generic loader from Excel file, given worksheet and a list of named ranges. Returns a dictionary of DataFrames, one for each range
+# The workbook is opened once for all the ranges. The ranges are also saved in a cache file next to the workbook, with one array for each column,
+# so later runs read the cache rather than the workbook, until the workbook is modified
+def LoadRangesFromExcel(ExcelFile, Worksheet, Ranges, UseCache = True):
+    CacheFile = os.path.splitext(ExcelFile)[0] + '-cache.npz'
+    Modified = os.path.getmtime(ExcelFile)
+    Columns = {}   # Columns of each range, keyed by 'worksheet!range#column'
+    if UseCache and os.path.exists(CacheFile):
+        with np.load(CacheFile, allow_pickle = True) as Cache:   # Columns of text are saved as object arrays
+            if Cache['Modified'] == Modified:   # Otherwise the workbook has been modified since the cache was saved
+                Columns = {Key: Cache[Key] for Key in Cache.files if Key != 'Modified'}
+    Missing = [Range for Range in Ranges if f'{Worksheet}!{Range}#0' not in Columns]
+    if Missing:
+        Workbook = load_workbook(filename=ExcelFile, read_only = True)
+        Sheet = Workbook[Worksheet]
+        for Range in Missing:
+            NamesRanges = Workbook.defined_names[Range].destinations
+            for Title, Coord in NamesRanges:
+                MinCol, MinRow, MaxCol, MaxRow = range_boundaries(Coord)
+                Data = Sheet.iter_rows(MinRow, MaxRow, MinCol, MaxCol, values_only = True)
+            ExtractedData = pd.DataFrame(Data)
+            for Column in ExtractedData.columns:
+                Columns[f'{Worksheet}!{Range}#{Column}'] = ExtractedData[Column].to_numpy()
+        Workbook.close()
+        if UseCache:
+            np.savez(CacheFile, Modified = Modified, **Columns)
+    Loaded = {}
+    for Range in Ranges:
+        Prefix = f'{Worksheet}!{Range}#'
+        Loaded[Range] = pd.DataFrame({int(Key[len(Prefix):]): Values for Key, Values in Columns.items() if Key.startswith(Prefix)})
+    return Loaded
 
 # Load data from Excel file
 def GetData():
-    Available = LoadFromExcel(ExcelFile, Worksheet, 'dAvailable')
-    People = LoadFromExcel(ExcelFile, Worksheet, 'dPeople')
-    PeopleHourly = LoadFromExcel(ExcelFile, Worksheet, 'dPeopleHourly')
-    PeopleMin = LoadFromExcel(ExcelFile, Worksheet, 'dPeopleMin')
-    SlotRequired = LoadFromExcel(ExcelFile, Worksheet, 'dPeopleRequired')
-    Shifts = LoadFromExcel(ExcelFile, Worksheet, 'dShifts')
-    ShiftSlots = LoadFromExcel(ExcelFile, Worksheet, 'dShiftSlots')
-    Slots = LoadFromExcel(ExcelFile, Worksheet, 'dSlots')
-    SurplusMax = LoadFromExcel(ExcelFile, Worksheet, 'dSurplusMax')
-    ShiftRequired = LoadFromExcel(ExcelFile, Worksheet, 'dShiftRequired')
-    TimePeriod = LoadFromExcel(ExcelFile, Worksheet, 'dTimePeriod')
+    Data = LoadRangesFromExcel(ExcelFile, Worksheet, ['dAvailable', 'dPeople', 'dPeopleHourly', 'dPeopleMin', 'dPeopleRequired', 'dShifts', 'dShiftSlots', 'dSlots', 'dSurplusMax', 'dShiftRequired', 'dTimePeriod'])   # Open the workbook once, for all ranges
+    Available = Data['dAvailable']
+    People = Data['dPeople']
+    PeopleHourly = Data['dPeopleHourly']
+    PeopleMin = Data['dPeopleMin']
+    SlotRequired = Data['dPeopleRequired']
+    Shifts = Data['dShifts']
+    ShiftSlots = Data['dShiftSlots']
+    Slots = Data['dSlots']
+    SurplusMax = Data['dSurplusMax']
+    ShiftRequired = Data['dShiftRequired']
+    TimePeriod = Data['dTimePeriod']
     return Available, People, PeopleHourly, PeopleMin, SlotRequired, Shifts, ShiftSlots, Slots, SurplusMax, ShiftRequired, TimePeriod
 
 # Declare model components and initialize data structures